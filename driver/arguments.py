@@ -198,9 +198,10 @@ def _check_mutex_args(parser, args, required=False):
 
 
 def _looks_like_search_input(filename):
-    with open(filename) as input_file:
-        first_line = next(input_file, "").rstrip()
-    return first_line == "begin_version"
+    # The input may be compressed.
+    with util.open_decompressed(filename) as input_file:
+        first_line = input_file.read(64).split(b"\n", 1)[0].rstrip()
+    return first_line == b"begin_version"
 
 
 def _set_components_automatically(parser, args):
@@ -2,10 +2,12 @@
 
 from . import limits
 from . import returncodes
+from . import util
 
 import logging
 import os
 import shlex
+import shutil
 import subprocess
 import sys
 
@@ -59,12 +61,38 @@ def check_call(nick, cmd, stdin=None, time_limit=None, memory_limit=None):
 
     sys.stdout.flush()
     if stdin:
-        with open(stdin) as stdin_file:
-            return subprocess.check_call(cmd, stdin=stdin_file, **kwargs)
+        with open(stdin, "rb") as stdin_file:
+            compression_format = util.get_compression_format(stdin_file)
+            if compression_format is None and stdin_file.seekable():
+                # Peeking moved the file position.
+                stdin_file.seek(0)
+                return subprocess.check_call(cmd, stdin=stdin_file, **kwargs)
+            return _check_call_with_piped_stdin(
+                cmd, stdin, stdin_file, compression_format, **kwargs)
     else:
         return subprocess.check_call(cmd, **kwargs)
 
 
+def _check_call_with_piped_stdin(cmd, stdin, stdin_file, compression_format,
+                                 **kwargs):
+    # Pass the input to the process through a pipe. We use this for
+    # compressed files, which we decompress on the fly so that we need no
+    # decompressed copy on disk, and for pipes, from which we have already
+    # read the peeked header.
+    with subprocess.Popen(cmd, stdin=subprocess.PIPE, **kwargs) as process:
+        try:
+            with util.get_decompressed_stream(
+                    stdin_file, compression_format, stdin) as input_file:
+                shutil.copyfileobj(input_file, process.stdin)
+            process.stdin.close()
+        except BrokenPipeError:
+            # The process terminated without reading all of its input.
+            pass
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+    return process.returncode
+
+
 def get_error_output_and_returncode(nick, cmd, time_limit=None, memory_limit=None):
     cmd = _replace_paths_with_strings(cmd)
     print_call_settings(nick, cmd, None, time_limit, memory_limit)
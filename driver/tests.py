@@ -4,16 +4,19 @@ Test module for Fast Downward driver script. Run with
     py.test driver/tests.py
 """
 
+import gzip
+import lzma
 import os
 from pathlib import Path
 import subprocess
 import sys
+import threading
 import traceback
 
 import pytest
 
 from .aliases import ALIASES, PORTFOLIOS
-from .arguments import EXAMPLES
+from .arguments import EXAMPLES, _looks_like_search_input
 from .call import check_call, _replace_paths_with_strings
 from . import limits
 from . import returncodes
@@ -131,3 +134,50 @@ def test_automatic_domain_file_name_computation():
         for filename in filenames:
             if "domain" not in filename:
                 assert find_domain_path(dirpath / filename)
+
+
+@pytest.mark.parametrize("suffix, compress", [
+    (".gz", gzip.compress),
+    (".xz", lzma.compress),
+])
+def test_compressed_input_files(tmp_path, suffix, compress):
+    gripper_dir = REPO_ROOT_DIR / "misc" / "tests" / "benchmarks" / "gripper"
+    for name in ["domain.pddl", "prob01.pddl"]:
+        content = (gripper_dir / name).read_bytes()
+        (tmp_path / (name + suffix)).write_bytes(compress(content))
+    task = tmp_path / ("prob01.pddl" + suffix)
+    assert find_domain_path(task) == tmp_path / ("domain.pddl" + suffix)
+
+    sas_file = tmp_path / ("output.sas" + suffix)
+    sas_file.write_bytes(compress(b"begin_version\n3\nend_version\n"))
+    assert _looks_like_search_input(sas_file)
+    output_file = tmp_path / "output.sas"
+    check_call("cat", ["sh", "-c", f"cat > {output_file}"], stdin=sas_file)
+    assert output_file.read_text() == "begin_version\n3\nend_version\n"
+
+
+def _write_to_fifo(path, content):
+    with open(path, "wb") as fifo:
+        fifo.write(content)
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="requires named pipes")
+@pytest.mark.parametrize("compress", [lambda content: content, gzip.compress])
+def test_input_files_from_pipes(tmp_path, compress):
+    content = b"begin_version\n3\nend_version\n"
+    fifo = tmp_path / "output.sas"
+    os.mkfifo(fifo)
+
+    writer = threading.Thread(
+        target=_write_to_fifo, args=(fifo, compress(content)))
+    writer.start()
+    assert _looks_like_search_input(fifo)
+    writer.join()
+
+    writer = threading.Thread(
+        target=_write_to_fifo, args=(fifo, compress(content)))
+    writer.start()
+    output_file = tmp_path / "copy.sas"
+    check_call("cat", ["sh", "-c", f"cat > {output_file}"], stdin=fifo)
+    writer.join()
+    assert output_file.read_bytes() == content
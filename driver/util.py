@@ -1,5 +1,12 @@
+from contextlib import contextmanager
+import gzip
+import lzma
 import os
 from pathlib import Path
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 from . import returncodes
 
@@ -8,6 +15,14 @@ DRIVER_DIR = Path(__file__).parent.resolve()
 REPO_ROOT_DIR = DRIVER_DIR.parent
 BUILDS_DIR = REPO_ROOT_DIR / "builds"
 
+# Magic numbers and file name suffixes of the supported compression formats.
+COMPRESSION_FORMATS = {
+    "gzip": (b"\x1f\x8b", ".gz"),
+    "xz": (b"\xfd7zXZ\x00", ".xz"),
+    "zstd": (b"\x28\xb5\x2f\xfd", ".zst"),
+}
+COMPRESSION_SUFFIXES = [suffix for _, suffix in COMPRESSION_FORMATS.values()]
+
 
 def get_elapsed_time():
     """
@@ -20,10 +35,66 @@ def get_elapsed_time():
     return sum(os.times()[:4])
 
 
+def get_compression_format(input_file):
+    """
+    Return the compression format of the given binary file object or None
+    if it is not compressed with one of the supported formats. We peek at
+    the header, so that no input is lost for pipes.
+    """
+    header = input_file.peek(8)[:8]
+    for name, (magic, _) in COMPRESSION_FORMATS.items():
+        if header.startswith(magic):
+            return name
+    return None
+
+
+def get_decompressed_stream(input_file, compression_format, path: Path):
+    """
+    Return a binary file object that decompresses the given file object
+    on the fly. Closing it does not close the given file object.
+    """
+    if compression_format == "gzip":
+        return gzip.GzipFile(fileobj=input_file, mode="rb")
+    elif compression_format == "xz":
+        return lzma.LZMAFile(input_file, "rb")
+    elif compression_format == "zstd":
+        if zstandard is None:
+            returncodes.exit_with_driver_unsupported_error(
+                f"Error: Reading the zstd-compressed file {path} requires "
+                "the zstandard Python package.")
+        return zstandard.ZstdDecompressor().stream_reader(
+            input_file, read_across_frames=True, closefd=False)
+    assert compression_format is None
+    return input_file
+
+
+@contextmanager
+def open_decompressed(path: Path):
+    """
+    Open the given file for reading in binary mode and decompress it on
+    the fly if it is compressed. The file is only opened once, so this
+    also works for pipes.
+    """
+    with open(path, "rb") as input_file:
+        compression_format = get_compression_format(input_file)
+        with get_decompressed_stream(
+                input_file, compression_format, path) as decompressed_file:
+            yield decompressed_file
+
+
 def find_domain_path(task_path: Path):
     """
     Find domain path for the given task using automatic naming rules.
+    For compressed tasks (e.g., "prob01.pddl.gz"), we apply the rules to
+    the name without the compression suffix. Domain files may be
+    compressed.
     """
+    domain_suffixes = [""] + COMPRESSION_SUFFIXES
+    if task_path.suffix in COMPRESSION_SUFFIXES:
+        # Prefer a domain file compressed like the task.
+        domain_suffixes.remove(task_path.suffix)
+        domain_suffixes.insert(0, task_path.suffix)
+        task_path = task_path.with_suffix("")
     domain_basenames = [
         "domain.pddl",
         task_path.stem + "-domain" + task_path.suffix,
@@ -33,9 +104,10 @@ def find_domain_path(task_path: Path):
     ]
 
     for domain_basename in domain_basenames:
-        domain_path = task_path.parent / domain_basename
-        if domain_path.exists():
-            return domain_path
+        for suffix in domain_suffixes:
+            domain_path = task_path.parent / (domain_basename + suffix)
+            if domain_path.exists():
+                return domain_path
 
     returncodes.exit_with_driver_input_error(
         "Error: Could not find domain file using automatic naming rules.")
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_BASE = os.path.dirname(os.path.dirname(DIR))
+TRANSLATE_DIR = os.path.join(REPO_BASE, "src", "translate")
+TRANSLATOR = os.path.join(TRANSLATE_DIR, "translate.py")
+BENCHMARKS_DIR = os.path.join(REPO_BASE, "misc", "tests", "benchmarks")
+
+sys.path.insert(0, TRANSLATE_DIR)
+
+
+def get_task_files(task):
+    task_file = os.path.join(BENCHMARKS_DIR, task)
+    domain_file = os.path.join(os.path.dirname(task_file), "domain.pddl")
+    return domain_file, task_file
+
+
+def translate(task, sas_file, args=()):
+    cmd = [sys.executable, TRANSLATOR, *get_task_files(task),
+           "--sas-file", str(sas_file), *args]
+    output = subprocess.check_output(cmd, encoding=sys.getfilesystemencoding())
+    with open(sas_file) as output_file:
+        return output, output_file.read()
+
+
+def test_domain_cache_with_derived_predicates(tmp_path):
+    task = "philosophers/p01-phil2.pddl"
+    cache_args = ["--domain-cache", str(tmp_path / "cache")]
+    _, expected = translate(task, tmp_path / "output.sas")
+    # The first run creates the cache entry and the second one uses it.
+    for run in range(2):
+        output, result = translate(task, tmp_path / "output.sas", cache_args)
+        assert result == expected
+    assert "Using cached domain" in output
+    assert "Normalizing task" not in output
+
+
+def test_grounding_budget_with_static_relations():
+    domain_file, task_file = get_task_files("satellite/p25-HC-pfile5.pddl")
+    # The translator modules parse the command line when they are imported.
+    sys.argv = ["translate.py", domain_file, task_file]
+    import build_model
+    import grounding_budget
+    import normalize
+    import pddl
+    import pddl_parser
+    import pddl_to_prolog
+
+    task = pddl_parser.open(domain_file, task_file)
+    normalize.normalize(task)
+    prog = pddl_to_prolog.translate(task)
+    budget = grounding_budget.GroundingBudget(task, max_actions=10 ** 9)
+    model = build_model.compute_model(
+        prog, precompute_static=True, budget=budget)
+    num_actions = sum(isinstance(atom.predicate, pddl.Action)
+                      for atom in model)
+    assert budget.num_actions == num_actions
+    assert budget.num_atoms == len(model)
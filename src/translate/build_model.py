@@ -1,13 +1,23 @@
 #! /usr/bin/env python3
 
 
+import gc
+import json
 import sys
 import itertools
+import time
+from operator import itemgetter
 
+import grounding_budget
 import pddl
 import timers
 from functools import reduce
 
+# In batched mode, the queue is processed in batches of at most this many
+# atoms. Larger batches amortize more interpreter overhead but keep more
+# unfiltered rule results in memory at the same time.
+MAX_BATCH_SIZE = 10000
+
 def convert_rules(prog):
     RULE_TYPES = {
         "join": JoinRule,
@@ -19,9 +29,11 @@ def convert_rules(prog):
         RuleType = RULE_TYPES[rule.type]
         new_effect, new_conditions = variables_to_numbers(
             rule.effect, rule.conditions)
-        rule = RuleType(new_effect, new_conditions)
-        rule.validate()
-        result.append(rule)
+        new_rule = RuleType(new_effect, new_conditions)
+        new_rule.validate()
+        new_rule.type = rule.type
+        new_rule.origin = getattr(rule, "origin", None)
+        result.append(new_rule)
     return result
 
 def variables_to_numbers(effect, conditions):
@@ -50,7 +62,53 @@ def variables_to_numbers(effect, conditions):
         new_conditions.append(pddl.Atom(cond.predicate, new_cond_args))
     return new_effect, new_conditions
 
+def tuple_getter(positions):
+    """Return a function mapping a sequence to the tuple of its entries at
+    the given positions. Unlike itemgetter, this always returns a tuple."""
+    if not positions:
+        return lambda seq: ()
+    elif len(positions) == 1:
+        position = positions[0]
+        return lambda seq: (seq[position],)
+    else:
+        return itemgetter(*positions)
+
+def get_effect_positions(effect, sources, convert_constant=None):
+    """Compute how to build the effect arguments of a rule from the
+    concatenation of the condition arguments and the constants of the effect.
+    sources is a list of (condition args, offset) pairs, where offset is the
+    position of the first condition argument in the concatenation.
+    Return the list of positions and the tuple of constants."""
+    var_positions = {}
+    for args, offset in sources:
+        for pos, arg in enumerate(args):
+            if isinstance(arg, int):
+                var_positions.setdefault(arg, offset + pos)
+    constant_offset = sum(len(args) for args, _ in sources)
+    positions = []
+    constants = []
+    for var_no, arg in enumerate(effect.args):
+        if isinstance(arg, int):
+            assert arg == var_no
+            positions.append(var_positions[arg])
+        else:
+            positions.append(constant_offset + len(constants))
+            if convert_constant is not None:
+                arg = convert_constant(arg)
+            constants.append(arg)
+    return positions, tuple(constants)
+
 class BuildRule:
+    def fire_batch(self, events, results):
+        # events is a list of (event_no, new_atom, cond_index) triples in the
+        # order in which the atoms were dequeued. Store the list of effect
+        # arguments produced by each event in results[event_no].
+        for event_no, new_atom, cond_index in events:
+            event_results = []
+            self.update_index(new_atom, cond_index)
+            self.fire(new_atom, cond_index,
+                      lambda predicate, args: event_results.append(tuple(args)))
+            results[event_no] = event_results
     def prepare_effect(self, new_atom, cond_index):
         effect_args = list(self.effect.args)
         cond = self.conditions[cond_index]
@@ -76,6 +134,18 @@ class JoinRule(BuildRule):
             [args.index(var) for var in common_vars]
             for args in (list(left_args), list(right_args))]
         self.atoms_by_key = ({}, {})
+        self.key_getters = [tuple_getter(positions)
+                            for positions in self.common_var_positions]
+        # For each condition index, we build the effect arguments from the
+        # arguments of the new atom, followed by those of its partner atom.
+        self.effect_positions = [
+            get_effect_positions(effect, [(left_args, 0),
+                                          (right_args, len(left_args))]),
+            get_effect_positions(effect, [(right_args, 0),
+                                          (left_args, len(right_args))])]
+        self.effect_getters = [
+            (tuple_getter(positions), constants)
+            for positions, constants in self.effect_positions]
     def validate(self):
         assert len(self.conditions) == 2, self
         left_args = self.conditions[0].args
@@ -108,6 +178,32 @@ class JoinRule(BuildRule):
                 if isinstance(var_no, int):
                     effect_args[var_no] = obj
             enqueue_func(self.effect.predicate, effect_args)
+    def fire_batch(self, events, results):
+        # First update the indices in event order and remember how many of
+        # the partners in the other index each event would have seen when
+        # processing the atoms one at a time. Then compute the results of
+        # all events of the batch at once.
+        joins = []
+        for event_no, new_atom, cond_index in events:
+            key = self.key_getters[cond_index](new_atom.args)
+            atoms_by_key = self.atoms_by_key[cond_index]
+            same_key_atoms = atoms_by_key.get(key)
+            if same_key_atoms is None:
+                atoms_by_key[key] = [new_atom]
+            else:
+                same_key_atoms.append(new_atom)
+            partners = self.atoms_by_key[1 - cond_index].get(key)
+            if partners:
+                joins.append((event_no, new_atom, cond_index,
+                              partners, len(partners)))
+            else:
+                results[event_no] = []
+        for event_no, new_atom, cond_index, partners, num_partners in joins:
+            get_effect, constants = self.effect_getters[cond_index]
+            args = new_atom.args
+            results[event_no] = [
+                get_effect(args + partner.args + constants)
+                for partner in itertools.islice(partners, num_partners)]
 
 class ProductRule(BuildRule):
     def __init__(self, effect, conditions):
@@ -172,13 +268,22 @@ class ProjectRule(BuildRule):
     def fire(self, new_atom, cond_index, enqueue_func):
         effect_args = self.prepare_effect(new_atom, cond_index)
         enqueue_func(self.effect.predicate, effect_args)
+    def fire_batch(self, events, results):
+        positions, constants = get_effect_positions(
+            self.effect, [(self.conditions[0].args, 0)])
+        get_effect = tuple_getter(positions)
+        for event_no, new_atom, cond_index in events:
+            results[event_no] = [get_effect(new_atom.args + constants)]
 
 class Unifier:
-    def __init__(self, rules):
+    def __init__(self, rules, ignored_predicates=frozenset()):
+        # Conditions on ignored_predicates are not matched. Atoms of these
+        # predicates must be added to the rule indices beforehand.
         self.predicate_to_rule_generator = {}
         for rule in rules:
             for i, cond in enumerate(rule.conditions):
-                self._insert_condition(rule, i)
+                if cond.predicate not in ignored_predicates:
+                    self._insert_condition(rule, i)
     def unify(self, atom):
         result = []
         generator = self.predicate_to_rule_generator.get(atom.predicate)
@@ -291,39 +396,295 @@ class Queue:
         if eff_tuple not in self.enqueued:
             self.enqueued.add(eff_tuple)
             self.queue.append(pddl.Atom(predicate, list(args)))
+    def push_all(self, effects):
+        # effects is a sequence of (predicate, list of argument tuples) pairs.
+        enqueued = self.enqueued
+        append = self.queue.append
+        for predicate, args_tuples in effects:
+            self.num_pushes += len(args_tuples)
+            for args in args_tuples:
+                eff_tuple = (predicate,) + args
+                if eff_tuple not in enqueued:
+                    enqueued.add(eff_tuple)
+                    append(pddl.Atom(predicate, args))
     def pop(self):
         result = self.queue[self.queue_pos]
         self.queue_pos += 1
         return result
+    def pop_batch(self, max_size):
+        end = min(len(self.queue), self.queue_pos + max_size)
+        result = self.queue[self.queue_pos:end]
+        self.queue_pos = end
+        return result
 
-def compute_model(prog):
+def compute_model(prog, batched=False, profile_file=None,
+                  precompute_static=False, budget=None):
+    """Compute the model of prog, one atom at a time. With batched=True,
+    the rules process a batch of dequeued atoms at once, which gives the same
+    result with less interpreter overhead. If profile_file is given, atoms
+    are processed one at a time and statistics for each rule are written to
+    that file as JSON (see write_profile). With precompute_static=True, the
+    static relations are computed first and stored in the indices of the
+    remaining rules (see compute_static_relations). If budget is given, it
+    is checked periodically (see grounding_budget.py)."""
     with timers.timing("Preparing model"):
         rules = convert_rules(prog)
-        unifier = Unifier(rules)
-        # unifier.dump()
         fact_atoms = sorted(fact.atom for fact in prog.facts)
-        queue = Queue(fact_atoms)
+        if profile_file is not None:
+            profiles = {rule: RuleProfile() for rule in rules}
+            def process(queue, unifier):
+                return process_queue_with_profile(queue, unifier, profiles)
+        elif batched:
+            def process(queue, unifier):
+                return process_queue_in_batches(queue, unifier, budget)
+        else:
+            def process(queue, unifier):
+                return process_queue(queue, unifier, budget)
 
     print("Generated %d rules." % len(rules))
+    static_atoms = []
+    auxiliary_atoms = 0
+    num_pushes = 0
+    static_predicates = frozenset()
+    if precompute_static:
+        with timers.timing("Computing static relations"):
+            static_predicates = get_static_predicates(rules, fact_atoms)
+            static_rules = [
+                rule for rule in rules
+                if all(cond.predicate in static_predicates
+                       for cond in rule.conditions)]
+            static_queue = Queue(fact_atoms)
+            auxiliary_atoms += process(static_queue, Unifier(static_rules))
+            num_pushes += static_queue.num_pushes
+            rules = [rule for rule in rules
+                     if any(cond.predicate not in static_predicates
+                            for cond in rule.conditions)]
+            fact_atoms = []
+            for atom in static_queue.queue:
+                if atom.predicate in static_predicates:
+                    static_atoms.append(atom)
+                else:
+                    fact_atoms.append(atom)
+            add_static_atoms_to_indices(rules, static_atoms)
+            if budget is not None:
+                # The queue of the model computation starts with the
+                # fact atoms, which we have already checked.
+                budget.check_model(static_queue.queue)
+                budget.start_new_list(len(fact_atoms), len(static_atoms))
+        print("%d static atoms" % len(static_atoms))
+
     with timers.timing("Computing model"):
-        relevant_atoms = 0
-        auxiliary_atoms = 0
-        while queue:
-            next_atom = queue.pop()
-            pred = next_atom.predicate
-            if isinstance(pred, str) and "$" in pred:
-                auxiliary_atoms += 1
-            else:
-                relevant_atoms += 1
-            matches = unifier.unify(next_atom)
-            for rule, cond_index in matches:
-                rule.update_index(next_atom, cond_index)
-                rule.fire(next_atom, cond_index, queue.push)
+        unifier = Unifier(rules, static_predicates)
+        # unifier.dump()
+        queue = Queue(fact_atoms)
+        auxiliary_atoms += process(queue, unifier)
+        num_pushes += queue.num_pushes
+        if budget is not None:
+            budget.check_model(queue.queue)
+        model = static_atoms + queue.queue
+        relevant_atoms = len(model) - auxiliary_atoms
     print("%d relevant atoms" % relevant_atoms)
     print("%d auxiliary atoms" % auxiliary_atoms)
-    print("%d final queue length" % len(queue.queue))
-    print("%d total queue pushes" % queue.num_pushes)
-    return queue.queue
+    print("%d final queue length" % len(model))
+    print("%d total queue pushes" % num_pushes)
+    if profile_file is not None:
+        write_profile(list(profiles), profiles, profile_file)
+    return model
+
+def get_static_predicates(rules, fact_atoms):
+    """Return the predicates whose relations do not depend on the fluent
+    atoms of the task: predicates that only occur in facts (like types and
+    static predicates of the task) and, recursively, predicates all of
+    whose rules only have conditions on static predicates (like the
+    auxiliary predicates joining static relations)."""
+    rules_by_head = {}
+    for rule in rules:
+        rules_by_head.setdefault(rule.effect.predicate, []).append(rule)
+    result = {atom.predicate for atom in fact_atoms
+              if atom.predicate not in rules_by_head}
+    changed = True
+    while changed:
+        changed = False
+        for predicate, head_rules in rules_by_head.items():
+            if predicate not in result and all(
+                    cond.predicate in result
+                    for rule in head_rules for cond in rule.conditions):
+                result.add(predicate)
+                changed = True
+    return frozenset(result)
+
+def add_static_atoms_to_indices(rules, static_atoms):
+    """Store the static atoms in the indices of the rules with conditions
+    on static predicates, so that firing these rules for the other
+    conditions directly looks up the matching static atoms."""
+    atoms_by_predicate = {}
+    for atom in static_atoms:
+        atoms_by_predicate.setdefault(atom.predicate, []).append(atom)
+    for rule in rules:
+        for cond_index, cond in enumerate(rule.conditions):
+            atoms = atoms_by_predicate.get(cond.predicate)
+            if atoms is None:
+                continue
+            constants = [(pos, arg) for pos, arg in enumerate(cond.args)
+                         if not isinstance(arg, int) and arg[0] != "?"]
+            for atom in atoms:
+                if all(atom.args[pos] == arg for pos, arg in constants):
+                    rule.update_index(atom, cond_index)
+
+def is_auxiliary_atom(atom):
+    pred = atom.predicate
+    return isinstance(pred, str) and "$" in pred
+
+def process_queue(queue, unifier, budget=None):
+    auxiliary_atoms = 0
+    while queue:
+        if (budget is not None and
+                queue.queue_pos % grounding_budget.CHECK_INTERVAL == 0):
+            budget.check_model(queue.queue)
+        next_atom = queue.pop()
+        if is_auxiliary_atom(next_atom):
+            auxiliary_atoms += 1
+        matches = unifier.unify(next_atom)
+        for rule, cond_index in matches:
+            rule.update_index(next_atom, cond_index)
+            rule.fire(next_atom, cond_index, queue.push)
+    return auxiliary_atoms
+
+class RuleProfile:
+    def __init__(self):
+        self.firings = 0
+        self.enqueue_attempts = 0
+        self.duplicates = 0
+        self.new_atoms = 0
+        self.time = 0.0
+    def add(self, other):
+        self.firings += other.firings
+        self.enqueue_attempts += other.enqueue_attempts
+        self.duplicates += other.duplicates
+        self.new_atoms += other.new_atoms
+        self.time += other.time
+    def to_dict(self):
+        return {
+            "firings": self.firings,
+            "enqueue_attempts": self.enqueue_attempts,
+            "duplicates": self.duplicates,
+            "new_atoms": self.new_atoms,
+            "time": self.time,
+        }
+
+def process_queue_with_profile(queue, unifier, profiles):
+    # Like process_queue, but measures each firing of a rule. Duplicates are
+    # the pushes that Queue.push rejects because the atom was enqueued
+    # before. The time includes the time for pushing the produced atoms.
+    auxiliary_atoms = 0
+    timer = time.perf_counter
+    while queue:
+        next_atom = queue.pop()
+        if is_auxiliary_atom(next_atom):
+            auxiliary_atoms += 1
+        matches = unifier.unify(next_atom)
+        for rule, cond_index in matches:
+            profile = profiles[rule]
+            num_pushes = queue.num_pushes
+            queue_length = len(queue.queue)
+            start_time = timer()
+            rule.update_index(next_atom, cond_index)
+            rule.fire(next_atom, cond_index, queue.push)
+            profile.time += timer() - start_time
+            attempts = queue.num_pushes - num_pushes
+            new_atoms = len(queue.queue) - queue_length
+            profile.firings += 1
+            profile.enqueue_attempts += attempts
+            profile.duplicates += attempts - new_atoms
+            profile.new_atoms += new_atoms
+    return auxiliary_atoms
+
+def get_predicate_name(predicate):
+    if isinstance(predicate, (pddl.Action, pddl.Axiom)):
+        return predicate.name
+    return predicate
+
+def format_atom(atom):
+    args = ["?%d" % arg if isinstance(arg, int) else arg for arg in atom.args]
+    return "%s(%s)" % (get_predicate_name(atom.predicate), ", ".join(args))
+
+def format_origin(origin):
+    if origin is None:
+        return None
+    kind, name = origin
+    return {"kind": kind, "name": name}
+
+def write_profile(rules, profiles, filename):
+    """Write the statistics of all rules, sorted by decreasing time, and
+    their sums for each origin to filename as JSON."""
+    rule_entries = []
+    profiles_by_origin = {}
+    for rule_no, rule in enumerate(rules):
+        profile = profiles[rule]
+        entry = {
+            "rule": "%s :- %s" % (
+                format_atom(rule.effect),
+                ", ".join(map(format_atom, rule.conditions))),
+            "number": rule_no,
+            "type": rule.type,
+            "origin": format_origin(rule.origin),
+        }
+        entry.update(profile.to_dict())
+        rule_entries.append(entry)
+        profiles_by_origin.setdefault(
+            rule.origin, RuleProfile()).add(profile)
+    rule_entries.sort(key=lambda entry: (-entry["time"], entry["number"]))
+    origin_entries = []
+    for origin, profile in profiles_by_origin.items():
+        entry = {"origin": format_origin(origin)}
+        entry.update(profile.to_dict())
+        origin_entries.append(entry)
+    origin_entries.sort(key=lambda entry: -entry["time"])
+    with open(filename, "w") as profile_file:
+        json.dump({"rules": rule_entries, "origins": origin_entries},
+                  profile_file, indent=2)
+    print("Wrote rule profile to %s." % filename)
+
+def process_queue_in_batches(queue, unifier, budget=None):
+    # The atoms derived from a batch are only enqueued after the whole
+    # batch has been processed, in the order in which process_queue would
+    # have enqueued them. Since atoms derived from the batch would only be
+    # dequeued after the batch anyway, the result is the same.
+    #
+    # The batches create many acyclic containers that survive for a while,
+    # which triggers frequent full runs of the cyclic garbage collector over
+    # the growing model. We therefore disable the collector in the meantime.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        auxiliary_atoms = 0
+        unify = unifier.unify
+        while queue:
+            if budget is not None:
+                budget.check_model(queue.queue)
+            batch = queue.pop_batch(MAX_BATCH_SIZE)
+            events_by_rule = {}
+            num_events = 0
+            for atom in batch:
+                for rule, cond_index in unify(atom):
+                    rule_events = events_by_rule.get(rule)
+                    if rule_events is None:
+                        events_by_rule[rule] = rule_events = []
+                    rule_events.append((num_events, atom, cond_index))
+                    num_events += 1
+            auxiliary_atoms += sum(map(is_auxiliary_atom, batch))
+            results = [None] * num_events
+            predicates = [None] * num_events
+            for rule, events in events_by_rule.items():
+                rule.fire_batch(events, results)
+                predicate = rule.effect.predicate
+                for event_no, _, _ in events:
+                    predicates[event_no] = predicate
+            queue.push_all(zip(predicates, results))
+        return auxiliary_atoms
+    finally:
+        if gc_was_enabled:
+            gc.enable()
 
 if __name__ == "__main__":
     import pddl_parser
@@ -0,0 +1,240 @@
+# compiled_instantiation: Faster instantiation of actions and axioms.
+#
+# Action.instantiate and Axiom.instantiate walk the condition and effect
+# trees for every ground action or axiom, build a variable mapping and
+# create a pddl.Atom for every condition to look it up in the fluent and
+# initial facts. Here, we compile each normalized schema once into a list of
+# literals whose arguments are given by positions in the tuple of
+# arguments of the ground action (followed by the objects of the universal
+# effect parameters), and look up ground literals as tuples. Instead of
+# creating new pddl.Atom objects for the fluent literals in the result, we
+# share one object per fluent literal.
+#
+# The results are identical to those of Action.instantiate and
+# Axiom.instantiate, including the order of conditions and effects. Schemas
+# with conditions that we do not know how to compile are instantiated with
+# these methods.
+
+from build_model import tuple_getter
+import pddl
+from pddl.effects import cartesian_product
+
+
+class NotCompilable(Exception):
+    pass
+
+
+def get_fact_key(atom):
+    return (atom.predicate,) + atom.args
+
+
+class CompiledLiteral:
+    def __init__(self, literal, slots, context):
+        # slots maps the variables to positions in the argument tuple. The
+        # key of the ground literal is computed from the concatenation of
+        # the predicate, the constant arguments and the argument tuple.
+        self.predicate = literal.predicate
+        self.negated = literal.negated
+        self.constants = (self.predicate,) + tuple(
+            arg for arg in literal.args if arg not in slots)
+        positions = [0]
+        next_constant_pos = 1
+        for arg in literal.args:
+            slot = slots.get(arg)
+            if slot is None:
+                positions.append(next_constant_pos)
+                next_constant_pos += 1
+            else:
+                positions.append(len(self.constants) + slot)
+        self.get_key = tuple_getter(positions)
+        if self.negated:
+            self.fluent_literals = context.negated_fluent_literals
+        else:
+            self.fluent_literals = context.fluent_literals
+        self.init_keys = context.init_keys
+
+    def instantiate(self, args, result):
+        """Append the fluent ground literal for the given arguments to result.
+        Return False iff the ground literal is false because of the initial
+        state (like Literal.instantiate raising Impossible)."""
+        key = self.get_key(self.constants + args)
+        fluent_literal = self.fluent_literals.get(key)
+        if fluent_literal is not None:
+            result.append(fluent_literal)
+        elif (key in self.init_keys) == self.negated:
+            return False
+        return True
+
+
+def compile_condition(condition, slots, context):
+    """Return the list of compiled literals of a normalized condition, or
+    None if the condition is always false."""
+    if isinstance(condition, pddl.ExistentialCondition):
+        condition = condition.parts[0]
+    if isinstance(condition, pddl.Conjunction):
+        parts = condition.parts
+    else:
+        parts = [condition]
+    result = []
+    for part in parts:
+        if isinstance(part, pddl.Literal):
+            result.append(CompiledLiteral(part, slots, context))
+        elif isinstance(part, pddl.Falsity):
+            return None
+        elif not isinstance(part, pddl.Truth):
+            raise NotCompilable()
+    return result
+
+
+def instantiate_literals(literals, args, result):
+    for literal in literals:
+        if not literal.instantiate(args, result):
+            return False
+    return True
+
+
+class CompiledEffect:
+    def __init__(self, effect, slots, context):
+        if effect.parameters:
+            slots = dict(slots)
+            for par in effect.parameters:
+                slots[par.name] = len(slots)
+        self.object_lists = [context.objects_by_type.get(par.type_name, [])
+                             for par in effect.parameters]
+        self.condition = compile_condition(effect.condition, slots, context)
+        self.literal = CompiledLiteral(effect.literal, slots, context)
+
+    def instantiate(self, args, result):
+        if self.condition is None:
+            return
+        if self.object_lists:
+            for object_tuple in cartesian_product(*self.object_lists):
+                self._instantiate(args + object_tuple, result)
+        else:
+            self._instantiate(args, result)
+
+    def _instantiate(self, args, result):
+        condition = []
+        if not instantiate_literals(self.condition, args, condition):
+            return
+        effects = []
+        if not self.literal.instantiate(args, effects):
+            raise pddl.conditions.Impossible()
+        if effects:
+            result.append((condition, effects[0]))
+
+
+def get_slots(parameters):
+    return {par.name: pos for pos, par in enumerate(parameters)}
+
+
+class CompiledAction:
+    def __init__(self, action, context):
+        self.action = action
+        self.num_parameters = len(action.parameters)
+        self.num_external_parameters = action.num_external_parameters
+        slots = get_slots(action.parameters)
+        self.precondition = compile_condition(
+            action.precondition, slots, context)
+        self.effects = [CompiledEffect(eff, slots, context)
+                        for eff in action.effects]
+
+    def instantiate(self, args, context):
+        args = tuple(args[:self.num_parameters])
+        if self.precondition is None:
+            return None
+        precondition = []
+        if not instantiate_literals(self.precondition, args, precondition):
+            return None
+        effects = []
+        for eff in self.effects:
+            eff.instantiate(args, effects)
+        if not effects:
+            return None
+        action = self.action
+        if context.metric:
+            if action.cost is None:
+                cost = 0
+            else:
+                var_mapping = {par.name: arg
+                               for par, arg in zip(action.parameters, args)}
+                cost = int(action.cost.instantiate(
+                    var_mapping, context.init_assignments).expression.value)
+        else:
+            cost = 1
+        name = "(%s %s)" % (
+            action.name, " ".join(args[:self.num_external_parameters]))
+        return pddl.PropositionalAction(name, precondition, effects, cost)
+
+
+class CompiledAxiom:
+    def __init__(self, axiom, context):
+        self.axiom = axiom
+        self.num_parameters = len(axiom.parameters)
+        self.num_external_parameters = axiom.num_external_parameters
+        self.condition = compile_condition(
+            axiom.condition, get_slots(axiom.parameters), context)
+
+    def instantiate(self, args, context):
+        args = tuple(args[:self.num_parameters])
+        if self.condition is None:
+            return None
+        condition = []
+        if not instantiate_literals(self.condition, args, condition):
+            return None
+        external_args = args[:self.num_external_parameters]
+        name = "(%s)" % " ".join((self.axiom.name,) + external_args)
+        effect = pddl.Atom(self.axiom.name, external_args)
+        return pddl.PropositionalAxiom(name, condition, effect)
+
+
+class InstantiationContext:
+    """Instantiates actions and axioms with compiled schemas, compiling
+    each schema on first use."""
+    def __init__(self, init_facts, init_assignments, fluent_facts,
+                 objects_by_type, metric):
+        self.init_facts = init_facts
+        self.init_assignments = init_assignments
+        self.fluent_facts = fluent_facts
+        self.objects_by_type = objects_by_type
+        self.metric = metric
+        self.init_keys = {get_fact_key(atom) for atom in init_facts}
+        # The shared objects for the positive and negative fluent literals.
+        self.fluent_literals = {get_fact_key(atom): atom
+                                for atom in fluent_facts}
+        self.negated_fluent_literals = {
+            key: atom.negate() for key, atom in self.fluent_literals.items()}
+        self.compiled_schemas = {}
+
+    def get_compiled_schema(self, schema):
+        try:
+            return self.compiled_schemas[schema]
+        except KeyError:
+            try:
+                if isinstance(schema, pddl.Action):
+                    compiled = CompiledAction(schema, self)
+                else:
+                    compiled = CompiledAxiom(schema, self)
+            except NotCompilable:
+                compiled = None
+            self.compiled_schemas[schema] = compiled
+            return compiled
+
+    def instantiate_action(self, action, args):
+        compiled = self.get_compiled_schema(action)
+        if compiled is not None:
+            return compiled.instantiate(args, self)
+        variable_mapping = {par.name: arg
+                            for par, arg in zip(action.parameters, args)}
+        return action.instantiate(
+            variable_mapping, self.init_facts, self.init_assignments,
+            self.fluent_facts, self.objects_by_type, self.metric)
+
+    def instantiate_axiom(self, axiom, args):
+        compiled = self.get_compiled_schema(axiom)
+        if compiled is not None:
+            return compiled.instantiate(args, self)
+        variable_mapping = {par.name: arg
+                            for par, arg in zip(axiom.parameters, args)}
+        return axiom.instantiate(
+            variable_mapping, self.init_facts, self.fluent_facts)
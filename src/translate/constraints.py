@@ -1,6 +1,18 @@
 import itertools
 from typing import Iterable, List, Tuple
 
+# Many constraint systems only differ in the names of their variables, so
+# we cache the solvability of systems up to renaming (see
+# ConstraintSystem.is_solvable). We clear the cache when it gets too large.
+MAX_SOLVABILITY_CACHE_SIZE = 100000
+_solvability_cache = {}
+
+
+def is_variable(term):
+    # Variables and invariant parameters (ints) can stand for any object.
+    return isinstance(term, int) or term[0] == "?"
+
+
 class InequalityDisjunction:
     def __init__(self, parts: List[Tuple[str, str]]):
         self.parts = parts
@@ -20,54 +32,40 @@ class EqualityConjunction:
 
         self._consistent = None
         self._representative = None # dictionary
-        self._eq_classes = None
 
     def __str__(self):
         conj = " and ".join([f"({v1} = {v2})" for (v1, v2) in self.equalities])
         return f"({conj})"
 
-    def _compute_equivalence_classes(self):
-        eq_classes = {}
-        for (v1, v2) in self.equalities:
-            c1 = eq_classes.setdefault(v1, {v1})
-            c2 = eq_classes.setdefault(v2, {v2})
-            if c1 is not c2:
-                if len(c2) > len(c1):
-                    v1, c1, v2, c2 = v2, c2, v1, c1
-                c1.update(c2)
-                for elem in c2:
-                    eq_classes[elem] = c1
-        self._eq_classes = eq_classes
-
     def _compute_representatives(self):
-        if not self._eq_classes:
-            self._compute_equivalence_classes()
-
-        # Choose a representative for each equivalence class. Objects are
-        # prioritized over variables and ints, but at most one object per
-        # equivalence class is allowed (otherwise the conjunction is
-        # inconsistent).
-        representative = {}
-        for eq_class in self._eq_classes.values():
-            if next(iter(eq_class)) in representative:
-                continue # we already processed this equivalence class
-            variables = [item for item in eq_class if isinstance(item, int) or
-                         item.startswith("?")]
-            objects = [item for item in eq_class if not isinstance(item, int)
-                       and not item.startswith("?")]
-
-            if len(objects) >= 2:
-                self._consistent = False
-                self._representative = None
-                return
-            if objects:
-                set_val = objects[0]
-            else:
-                set_val = variables[0]
-            for entry in eq_class:
-                representative[entry] = set_val
+        # We compute the equivalence classes with a union-find structure
+        # whose roots serve as representatives. Objects are prioritized over
+        # variables and ints, but at most one object per equivalence class is
+        # allowed (otherwise the conjunction is inconsistent).
+        parent = {}
+
+        def find(term):
+            parent.setdefault(term, term)
+            while parent[term] != term:
+                # Path halving.
+                parent[term] = parent[parent[term]]
+                term = parent[term]
+            return term
+
+        for (v1, v2) in self.equalities:
+            root1 = find(v1)
+            root2 = find(v2)
+            if root1 == root2:
+                continue
+            if not is_variable(root2):
+                if not is_variable(root1):
+                    self._consistent = False
+                    self._representative = None
+                    return
+                root1, root2 = root2, root1
+            parent[root2] = root1
         self._consistent = True
-        self._representative = representative
+        self._representative = {term: find(term) for term in parent}
 
     def is_consistent(self):
         if self._consistent is None:
@@ -147,7 +145,45 @@ class ConstraintSystem:
         self.ineq_disjunctions.extend(other.ineq_disjunctions)
         self.not_constant.extend(other.not_constant)
 
+    def _get_canonical_key(self):
+        """Return a representation of the system in which the variables
+           and invariant parameters are renamed to 0, 1, ... in the order of
+           their first occurrence. Systems that are equal up to renaming have
+           the same key and are either both solvable or both unsolvable."""
+        # Objects keep their names. The keys only contain the flattened
+        # pairs of terms of the conjunctions and disjunctions.
+        names = {}
+
+        def rename(terms):
+            result = []
+            for term in terms:
+                name = names.get(term)
+                if name is None:
+                    name = len(names) if is_variable(term) else term
+                    names[term] = name
+                result.append(name)
+            return tuple(result)
+
+        chain = itertools.chain.from_iterable
+        equality_DNFs = tuple(
+            tuple(rename(chain(eq_conjunction.equalities))
+                  for eq_conjunction in eq_DNF)
+            for eq_DNF in self.equality_DNFs)
+        ineq_disjunctions = tuple(rename(chain(ineq_disj.parts))
+                                  for ineq_disj in self.ineq_disjunctions)
+        return equality_DNFs, ineq_disjunctions, rename(self.not_constant)
+
     def is_solvable(self):
+        key = self._get_canonical_key()
+        result = _solvability_cache.get(key)
+        if result is None:
+            if len(_solvability_cache) >= MAX_SOLVABILITY_CACHE_SIZE:
+                _solvability_cache.clear()
+            result = self._is_solvable()
+            _solvability_cache[key] = result
+        return result
+
+    def _is_solvable(self):
         # cf. top of class for explanation
         def inequality_disjunction_ok(ineq_disj, representative):
             for inequality in ineq_disj.parts:
@@ -166,8 +202,7 @@ class ConstraintSystem:
             # inequality disjunction there is an inequality where the two terms
             # are in different equivalence classes.
             representative = combined.get_representative()
-            if any(not isinstance(representative.get(s, s), int) and
-                   representative.get(s, s)[0] != "?"
+            if any(not is_variable(representative.get(s, s))
                    for s in self.not_constant):
                 continue
             if any(not inequality_disjunction_ok(d, representative)
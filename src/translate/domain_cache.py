@@ -0,0 +1,180 @@
+# domain_cache: Reuse the parsed and normalized domain across tasks.
+#
+# Parsing and normalizing a large domain can take a considerable part of the
+# translation time of small tasks, and benchmark sets contain many tasks of
+# the same domain. We store the domain after normalization in a cache
+# directory, keyed by a hash of the domain file and of the translator
+# sources (so that changes to the parser or to the normalization invalidate
+# the cache), and only parse the task file for domains we have seen before.
+#
+# Normalizing the goal of a task can add axioms that interact with the
+# axioms of the domain, so we only use the cache for tasks whose goal is a
+# conjunction of literals, which normalization leaves untouched. Warnings
+# about the domain are only printed when the entry is created.
+
+from functools import partial
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+import normalize
+import pddl
+import pddl_parser
+from pddl_parser import pddl_file
+from pddl_parser import parsing_functions
+import timers
+import tools
+
+ENTRY_SUFFIX = ".domain.pickle"
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def get_translator_sources():
+    translator_dir = os.path.dirname(os.path.abspath(__file__))
+    for dirpath, dirnames, filenames in os.walk(translator_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                yield os.path.join(dirpath, filename)
+
+
+def update_hash_with_file(hash, filename):
+    with open(filename, "rb") as input_file:
+        for data in iter(partial(input_file.read, READ_CHUNK_SIZE), b""):
+            hash.update(data)
+
+
+def get_cache_key(domain_filename, max_dnf_size):
+    hash = hashlib.sha256()
+    hash.update(sys.version.encode())
+    # The normalized domain depends on the max DNF size.
+    hash.update(repr(max_dnf_size).encode())
+    for source in get_translator_sources():
+        update_hash_with_file(hash, source)
+    update_hash_with_file(hash, domain_filename)
+    return hash.hexdigest()
+
+
+def has_simple_goal(task):
+    # Like normalize.substitute_complicated_goal.
+    goal = task.goal
+    if isinstance(goal, pddl.Conjunction):
+        return all(isinstance(part, pddl.Literal) for part in goal.parts)
+    return isinstance(goal, pddl.Literal)
+
+
+def load_entry(entry_filename):
+    try:
+        with open(entry_filename, "rb") as entry_file:
+            with tools.garbage_collection_disabled():
+                entry = pickle.load(entry_file)
+        # Mark the entry as recently used.
+        os.utime(entry_filename)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # We treat unreadable or incompatible entries as missing.
+        print(f"Ignoring cache entry {entry_filename}: {e}")
+        return None
+    return entry
+
+
+def store_entry(cache_dir, entry_filename, entry, max_size=None):
+    temp_filename = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first, so that concurrent translator
+        # runs never see incomplete entries.
+        fd, temp_filename = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as entry_file:
+            with tools.garbage_collection_disabled():
+                pickle.dump(entry, entry_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filename, entry_filename)
+        temp_filename = None
+        if max_size is not None:
+            remove_least_recently_used_entries(cache_dir, max_size)
+    except (OSError, pickle.PicklingError, RecursionError) as e:
+        print(f"Could not write cache entry {entry_filename}: {e}")
+    finally:
+        if temp_filename is not None:
+            try:
+                os.remove(temp_filename)
+            except OSError:
+                pass
+
+
+def remove_least_recently_used_entries(cache_dir, max_size):
+    entries = []
+    for filename in os.listdir(cache_dir):
+        if filename.endswith(ENTRY_SUFFIX):
+            path = os.path.join(cache_dir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_size -= size
+
+
+def open_and_normalize(domain_filename, task_filename, max_dnf_size):
+    task = pddl_parser.open(domain_filename, task_filename)
+    with timers.timing("Normalizing task"):
+        normalize.normalize(task, max_dnf_size)
+    return task
+
+
+def open_task(domain_filename, task_filename, cache_dir, max_size,
+              max_dnf_size=None):
+    """Parse the task like pddl_parser.open and normalize it with the given
+    max DNF size. If the goal of the task is a conjunction of literals, we
+    reuse the normalized domain from the cache. max_size is the max total
+    size of the cache in bytes."""
+    try:
+        key = get_cache_key(domain_filename, max_dnf_size)
+    except OSError:
+        # Let the parser report the error.
+        return open_and_normalize(domain_filename, task_filename, max_dnf_size)
+    entry_filename = os.path.join(cache_dir, key + ENTRY_SUFFIX)
+    entry = load_entry(entry_filename)
+    symbols = parsing_functions.SymbolTable()
+    context = parsing_functions.Context()
+
+    if entry is not None:
+        domain, axiom_counter, domain_symbols = entry
+        symbols.symbols = {symbol: symbol for symbol in domain_symbols}
+        task_pddl = pddl_file.parse_pddl_file("task", task_filename, symbols)
+        # Normalization can create actions with the same name, so we
+        # cannot check the actions for duplicates again.
+        task = parsing_functions.parse_task_for_domain(
+            context, domain, task_pddl, check_domain=False)
+        if not has_simple_goal(task):
+            return open_and_normalize(
+                domain_filename, task_filename, max_dnf_size)
+        task.axiom_counter = axiom_counter
+        print("Using cached domain %s" % entry_filename)
+        return task
+
+    domain_pddl = pddl_file.parse_pddl_file("domain", domain_filename, symbols)
+    domain_symbols = list(symbols.symbols)
+    task_pddl = pddl_file.parse_pddl_file("task", task_filename, symbols)
+    domain = parsing_functions.parse_domain(context, domain_pddl)
+    task = parsing_functions.parse_task_for_domain(context, domain, task_pddl)
+    # Normalization replaces complicated goals, so we test this first.
+    use_cache = has_simple_goal(task)
+    with timers.timing("Normalizing task"):
+        # Normalization modifies the lists of the domain in place.
+        normalize.normalize(task, max_dnf_size)
+    if use_cache:
+        entry = (domain, task.axiom_counter, domain_symbols)
+        store_entry(cache_dir, entry_filename, entry, max_size)
+    return task
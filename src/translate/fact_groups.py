@@ -8,29 +8,55 @@ from typing import Dict, List, Set, Tuple
 DEBUG = False
 
 
-def expand_group(group, task, reachable_facts):
+def get_counted_position(fact):
+    try:
+        return list(fact.args).index("?X")
+    except ValueError:
+        return None
+
+def index_reachable_facts(groups, task, reachable_facts):
+    """Map each pair of a predicate and a position at which the groups
+    count objects to a dictionary from the arguments of the group facts
+    (with "?X" at that position) to the matching reachable facts. The
+    matching facts are ordered like their objects in task.objects."""
+    counted_positions = {}
+    for group in groups:
+        for fact in group:
+            pos = get_counted_position(fact)
+            if pos is not None:
+                counted_positions.setdefault(fact.predicate, set()).add(pos)
+    object_index = {obj.name: index for index, obj in enumerate(task.objects)}
+    index = {}
+    for fact in reachable_facts:
+        for pos in counted_positions.get(fact.predicate, ()):
+            obj_index = object_index.get(fact.args[pos])
+            if obj_index is not None:
+                args = list(fact.args)
+                args[pos] = "?X"
+                matches = index.setdefault((fact.predicate, pos), {})
+                matches.setdefault(tuple(args), []).append((obj_index, fact))
+    for matches in index.values():
+        for key, facts in matches.items():
+            facts.sort(key=lambda entry: entry[0])
+            matches[key] = [fact for _, fact in facts]
+    return index
+
+def expand_group(group, reachable_facts, reachable_fact_index):
     result = []
     for fact in group:
-        try:
-            pos = list(fact.args).index("?X")
-        except ValueError:
+        pos = get_counted_position(fact)
+        if pos is None:
             if fact in reachable_facts:
                 result.append(fact)
         else:
-            # NOTE: This could be optimized by only trying objects of the correct
-            #       type, or by using a unifier which directly generates the
-            #       applicable objects. It is not worth optimizing this at this stage,
-            #       though.
-            for obj in task.objects:
-                newargs = list(fact.args)
-                newargs[pos] = obj.name
-                atom = pddl.Atom(fact.predicate, newargs)
-                if atom in reachable_facts:
-                    result.append(atom)
+            matches = reachable_fact_index.get((fact.predicate, pos), {})
+            result.extend(matches.get(tuple(fact.args), ()))
     return result
 
 def instantiate_groups(groups, task, reachable_facts):
-    return [expand_group(group, task, reachable_facts) for group in groups]
+    reachable_fact_index = index_reachable_facts(groups, task, reachable_facts)
+    return [expand_group(group, reachable_facts, reachable_fact_index)
+            for group in groups]
 
 class GroupCoverQueue:
     def __init__(self, groups):
@@ -120,11 +146,19 @@ def compute_groups(task: pddl.Task, atoms: Set[pddl.Literal],
         List[List[str]], # translation_key
         # -> string representations of group atoms (plus one for "other value")
         ]:
-    groups = invariant_finder.get_groups(task, reachable_action_params)
+    groups = invariant_finder.get_groups(
+        task, reachable_action_params, atoms)
 
     with timers.timing("Instantiating groups"):
         groups = instantiate_groups(groups, task, atoms)
 
+    return select_groups(groups, atoms, negative_in_goal)
+
+def select_groups(groups: List[List[pddl.Atom]], atoms: Set[pddl.Literal],
+    negative_in_goal: Set[pddl.Atom]) -> Tuple[
+        List[List[pddl.Atom]], List[List[pddl.Atom]], List[List[str]]]:
+    """Choose the groups for the variables among the mutex groups of
+    reachable atoms. Returns the same as compute_groups."""
     # Sort here already to get deterministic mutex groups.
     groups = sort_groups(groups)
     # TODO: I think that collect_all_mutex_groups should do the same thing
@@ -1,5 +1,3 @@
-import sys
-
 import pddl
 import pddl_to_prolog
 
@@ -23,8 +21,88 @@ class OccurrencesTracker:
     def variables(self):
         return set(self.occurrences)
 
+class RelationStatistics:
+    """Cardinalities of the relations of a Datalog program, gathered from
+    its facts. For static predicates (those that do not occur in the head of
+    any rule), the facts are the whole relation. For the other predicates,
+    we assume that each argument position can take all values that occur at
+    that position in the facts (or all objects if there are no facts) in all
+    combinations."""
+    def __init__(self, prog):
+        values_by_predicate = {}
+        sizes = {}
+        for fact in prog.facts:
+            atom = fact.atom
+            values = values_by_predicate.get(atom.predicate)
+            if values is None:
+                values = [set() for _ in atom.args]
+                values_by_predicate[atom.predicate] = values
+            for pos, arg in enumerate(atom.args):
+                values[pos].add(arg)
+            sizes[atom.predicate] = sizes.get(atom.predicate, 0) + 1
+        self.num_objects = max(len(prog.objects), 1)
+        self.derived_predicates = {rule.effect.predicate
+                                   for rule in prog.rules}
+        self.domain_sizes = {
+            predicate: [len(pos_values) for pos_values in values]
+            for predicate, values in values_by_predicate.items()}
+        self.sizes = sizes
+    def get_estimate(self, atom):
+        """Return the estimated size of the relation of the given condition
+        atom and the estimated number of distinct values of its variables."""
+        domain_sizes = self.domain_sizes.get(atom.predicate)
+        if domain_sizes is None:
+            domain_sizes = [self.num_objects] * len(atom.args)
+        if (atom.predicate in self.derived_predicates or
+                atom.predicate not in self.sizes):
+            size = 1
+            for domain_size in domain_sizes:
+                size *= domain_size
+        else:
+            size = self.sizes[atom.predicate]
+        var_domain_sizes = {}
+        for arg, domain_size in zip(atom.args, domain_sizes):
+            if arg[0] == "?":
+                var_domain_sizes[arg] = domain_size
+            else:
+                # Only atoms with the given constant match.
+                size /= domain_size
+        return JoinSizeEstimate(size, var_domain_sizes)
+
+class JoinSizeEstimate:
+    def __init__(self, size, var_domain_sizes):
+        self.size = max(size, 1)
+        self.var_domain_sizes = {
+            var: min(domain_size, self.size)
+            for var, domain_size in var_domain_sizes.items()}
+    def join(self, other):
+        # Standard estimate assuming uniformly distributed and independent
+        # values: each common variable reduces the size of the cross product
+        # by the larger number of its distinct values.
+        size = self.size * other.size
+        var_domain_sizes = dict(self.var_domain_sizes)
+        for var, domain_size in other.var_domain_sizes.items():
+            own_domain_size = var_domain_sizes.get(var)
+            if own_domain_size is None:
+                var_domain_sizes[var] = domain_size
+            else:
+                size /= max(domain_size, own_domain_size)
+                var_domain_sizes[var] = min(domain_size, own_domain_size)
+        return JoinSizeEstimate(size, var_domain_sizes)
+    def project(self, variables):
+        var_domain_sizes = {var: self.var_domain_sizes[var]
+                            for var in variables}
+        size = 1
+        for domain_size in var_domain_sizes.values():
+            size *= domain_size
+        return JoinSizeEstimate(min(self.size, size), var_domain_sizes)
+
 class CostMatrix:
-    def __init__(self, joinees):
+    def __init__(self, joinees, estimates=None):
+        # If estimates (a dictionary mapping joinees to JoinSizeEstimates)
+        # is given, we prefer joins with small estimated results and only
+        # break ties by the number of variables.
+        self.estimates = estimates
         self.joinees = []
         self.cost_matrix = []
         for joinee in joinees:
@@ -40,10 +118,10 @@ class CostMatrix:
         del self.joinees[index]
     def find_min_pair(self):
         assert len(self.joinees) >= 2
-        min_cost = (sys.maxsize, sys.maxsize)
+        min_cost = None
         for i, row in enumerate(self.cost_matrix):
             for j, entry in enumerate(row):
-                if entry < min_cost:
+                if min_cost is None or entry < min_cost:
                     min_cost = entry
                     left_index, right_index = i, j
         return left_index, right_index
@@ -60,9 +138,16 @@ class CostMatrix:
         if len(left_vars) > len(right_vars):
             left_vars, right_vars = right_vars, left_vars
         common_vars = left_vars & right_vars
-        return (len(left_vars) - len(common_vars),
+        cost = (len(left_vars) - len(common_vars),
                 len(right_vars) - len(common_vars),
                 -len(common_vars))
+        if self.estimates is not None:
+            join_estimate = self.estimates[left_joinee].join(
+                self.estimates[right_joinee])
+            # Join rules need a common variable, so pairs without one
+            # (cross products) come last.
+            cost = (not common_vars, join_estimate.size) + cost
+        return cost
     def can_join(self):
         return len(self.joinees) >= 2
 
@@ -81,9 +166,14 @@ class ResultList:
         self.result.append(rule)
         return rule.effect
 
-def greedy_join(rule, name_generator):
+def greedy_join(rule, name_generator, statistics=None):
     assert len(rule.conditions) >= 2
-    cost_matrix = CostMatrix(rule.conditions)
+    if statistics is None:
+        estimates = None
+    else:
+        estimates = {cond: statistics.get_estimate(cond)
+                     for cond in rule.conditions}
+    cost_matrix = CostMatrix(rule.conditions, estimates)
     occurrences = OccurrencesTracker(rule)
     result = ResultList(rule, name_generator)
 
@@ -100,7 +190,13 @@ def greedy_join(rule, name_generator):
             retained_vars = joinee_vars & (effect_vars | common_vars)
             if retained_vars != joinee_vars:
                 joinees[i] = result.add_rule("project", [joinee], sorted(retained_vars))
+                if estimates is not None:
+                    estimates[joinees[i]] = estimates[joinee].project(
+                        retained_vars)
         joint_condition = result.add_rule("join", joinees, sorted(effect_vars))
+        if estimates is not None:
+            estimates[joint_condition] = estimates[joinees[0]].join(
+                estimates[joinees[1]]).project(effect_vars)
         cost_matrix.add_entry(joint_condition)
         occurrences.update(joint_condition, +1)
 
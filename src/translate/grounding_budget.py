@@ -0,0 +1,144 @@
+# grounding_budget: Abort grounding early if the task is too big.
+#
+# The limits are checked periodically while computing the model and while
+# instantiating the actions and axioms. If a limit is exceeded, we print a
+# report of the ground size of each action schema (the number of ground
+# actions reached so far and the upper bound given by the numbers of
+# objects of the parameter types), optionally write it to a JSON file, and
+# raise GroundingBudgetExceeded. The translator then exits with the exit
+# code TRANSLATE_OUT_OF_GROUNDING_BUDGET.
+
+from collections import defaultdict
+import json
+
+import options
+import pddl
+import tools
+
+# How many atoms the callers process between two checks of the budget.
+CHECK_INTERVAL = 10000
+
+
+class GroundingBudgetExceeded(Exception):
+    pass
+
+
+def get_num_objects_by_type(task):
+    supertypes = {type.name: type.supertype_names for type in task.types}
+    result = defaultdict(int)
+    for obj in task.objects:
+        result[obj.type_name] += 1
+        for type_name in supertypes[obj.type_name]:
+            result[type_name] += 1
+    return result
+
+
+class GroundingBudget:
+    def __init__(self, task, max_atoms=None, max_actions=None,
+                 max_memory_in_kb=None, report_file=None):
+        self.task = task
+        self.max_atoms = max_atoms
+        self.max_actions = max_actions
+        self.max_memory_in_kb = max_memory_in_kb
+        self.report_file = report_file
+        self.num_actions_by_schema = defaultdict(int)
+        self.num_actions = 0
+        self.num_atoms = 0
+        # Position up to which we have checked the current list of atoms
+        # and number of model atoms that are not in that list.
+        self.num_checked_atoms = 0
+        self.num_other_atoms = 0
+
+    def check_model(self, atoms, num_atoms=None):
+        """Check the budget during the model computation. atoms is the list
+        of model atoms computed so far, which may only grow between calls
+        (see start_new_list). num_atoms is the size of the model if atoms
+        only contains part of it."""
+        for atom in atoms[self.num_checked_atoms:]:
+            if isinstance(atom.predicate, pddl.Action):
+                self.num_actions_by_schema[atom.predicate] += 1
+                self.num_actions += 1
+        self.num_checked_atoms = len(atoms)
+        if num_atoms is None:
+            num_atoms = self.num_other_atoms + len(atoms)
+        self.num_atoms = num_atoms
+        if self.max_atoms is not None and num_atoms > self.max_atoms:
+            self.abort("model computation",
+                       "more than %d atoms" % self.max_atoms)
+        if self.max_actions is not None and self.num_actions > self.max_actions:
+            self.abort("model computation",
+                       "more than %d actions" % self.max_actions)
+        self.check_memory("model computation")
+
+    def start_new_list(self, num_checked_atoms, num_other_atoms):
+        """Continue the checks with a new list of atoms whose first
+        num_checked_atoms atoms have already been checked. num_other_atoms
+        is the number of model atoms that are not in the new list."""
+        self.num_checked_atoms = num_checked_atoms
+        self.num_other_atoms = num_other_atoms
+
+    def check_memory(self, stage):
+        if self.max_memory_in_kb is None:
+            return
+        try:
+            memory = tools.get_peak_memory_in_kb()
+        except Warning as warning:
+            print(warning)
+            print("Ignoring the memory budget.")
+            self.max_memory_in_kb = None
+        else:
+            if memory > self.max_memory_in_kb:
+                self.abort(stage, "more than %d KB memory" %
+                           self.max_memory_in_kb)
+
+    def get_report(self, stage, reason):
+        num_objects_by_type = get_num_objects_by_type(self.task)
+        schemas = []
+        for action in self.task.actions:
+            upper_bound = 1
+            for par in action.parameters:
+                upper_bound *= num_objects_by_type[par.type_name]
+            schemas.append({
+                "name": action.name,
+                "arity": len(action.parameters),
+                "reached": self.num_actions_by_schema[action],
+                "upper_bound": upper_bound,
+            })
+        schemas.sort(key=lambda schema: (-schema["reached"],
+                                         -schema["upper_bound"]))
+        return {
+            "stage": stage,
+            "reason": reason,
+            "atoms": self.num_atoms,
+            "actions": self.num_actions,
+            "schemas": schemas,
+        }
+
+    def abort(self, stage, reason):
+        report = self.get_report(stage, reason)
+        print()
+        print("Grounding budget exceeded during %s: %s" % (stage, reason))
+        print("Ground actions per schema (reached so far / upper bound):")
+        for schema in report["schemas"]:
+            print("  %s: %d / %d" % (schema["name"], schema["reached"],
+                                     schema["upper_bound"]))
+        if self.report_file is not None:
+            with open(self.report_file, "w") as report_file:
+                json.dump(report, report_file, indent=2)
+            print("Wrote grounding report to %s." % self.report_file)
+        raise GroundingBudgetExceeded(reason)
+
+
+def get_budget(task):
+    """Return the grounding budget set by the options, or None if there
+    are no limits."""
+    if (options.grounding_max_atoms is None and
+            options.grounding_max_actions is None and
+            options.grounding_max_memory is None):
+        return None
+    max_memory_in_kb = None
+    if options.grounding_max_memory is not None:
+        max_memory_in_kb = options.grounding_max_memory * 1024
+    return GroundingBudget(
+        task, options.grounding_max_atoms, options.grounding_max_actions,
+        max_memory_in_kb, options.grounding_report)
@@ -2,23 +2,36 @@
 
 
 from collections import defaultdict
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 import build_model
+import compiled_instantiation
+import grounding_budget
+import options
 import pddl_to_prolog
 import pddl
+import seminaive_model
 import timers
 
-def get_fluent_facts(task, model):
+def get_fluent_predicates(task):
     fluent_predicates = set()
     for action in task.actions:
         for effect in action.effects:
             fluent_predicates.add(effect.literal.predicate)
     for axiom in task.axioms:
         fluent_predicates.add(axiom.name)
+    return fluent_predicates
+
+def get_fluent_facts(task, model):
+    fluent_predicates = get_fluent_predicates(task)
     return {fact for fact in model
             if fact.predicate in fluent_predicates}
 
+def get_model_predicates(task):
+    # The predicates of all model atoms that instantiate uses.
+    return (get_fluent_predicates(task) | set(task.actions) |
+            set(task.axioms) | {"@goal-reachable"})
+
 def get_objects_by_type(typed_objects, types):
     result = defaultdict(list)
     supertypes = {}
@@ -53,10 +66,15 @@ def instantiate_goal(goal, init_facts, fluent_facts):
 
 # The input task must have been normalized
 # The model has been computed by build_model.compute_model
-def instantiate(task: pddl.Task, model: Any) -> Tuple[
+# With lazy_actions, the actions are instantiated on demand by the returned
+# iterator, which can only be consumed once.
+def instantiate(task: pddl.Task, model: Any,
+                budget: Optional[grounding_budget.GroundingBudget] = None,
+                lazy_actions: bool = False
+                ) -> Tuple[
              bool, # relaxed_reachable
              Set[pddl.Literal], # fluent_facts (ground)
-             List[pddl.PropositionalAction], # instantiated_actions
+             Iterable[pddl.PropositionalAction], # instantiated_actions
              Optional[List[pddl.Literal]], # instantiated_goal
              List[pddl.PropositionalAxiom], # instantiated_axioms
              Dict[pddl.Action, List[str]] # reachable_action_parameters
@@ -72,11 +90,17 @@ def instantiate(task: pddl.Task, model: Any) -> Tuple[
             init_facts.add(element)
 
     type_to_objects = get_objects_by_type(task.objects, task.types)
+    context = compiled_instantiation.InstantiationContext(
+        init_facts, init_assignments, fluent_facts, type_to_objects,
+        task.use_min_cost_metric)
 
-    instantiated_actions = []
+    action_atoms = []
     instantiated_axioms = []
     reachable_action_parameters = defaultdict(list)
-    for atom in model:
+    for atom_no, atom in enumerate(model):
+        if (budget is not None and
+                atom_no % grounding_budget.CHECK_INTERVAL == 0):
+            budget.check_memory("instantiation")
         if isinstance(atom.predicate, pddl.Action):
             action = atom.predicate
             parameters = action.parameters
@@ -87,24 +111,29 @@ def instantiate(task: pddl.Task, model: Any) -> Tuple[
             # actions with the same name after normalization, and we
             # want to distinguish their instantiations.
             reachable_action_parameters[action].append(inst_parameters)
-            variable_mapping = {par.name: arg
-                                for par, arg in zip(parameters, atom.args)}
-            inst_action = action.instantiate(
-                variable_mapping, init_facts, init_assignments,
-                fluent_facts, type_to_objects,
-                task.use_min_cost_metric)
-            if inst_action:
-                instantiated_actions.append(inst_action)
+            action_atoms.append(atom)
         elif isinstance(atom.predicate, pddl.Axiom):
             axiom = atom.predicate
-            variable_mapping = {par.name: arg
-                                for par, arg in zip(axiom.parameters, atom.args)}
-            inst_axiom = axiom.instantiate(variable_mapping, init_facts, fluent_facts)
+            inst_axiom = context.instantiate_axiom(axiom, atom.args)
             if inst_axiom:
                 instantiated_axioms.append(inst_axiom)
         elif atom.predicate == "@goal-reachable":
             relaxed_reachable = True
 
+    def instantiate_actions():
+        for atom_no, atom in enumerate(action_atoms):
+            if (budget is not None and
+                    atom_no % grounding_budget.CHECK_INTERVAL == 0):
+                budget.check_memory("instantiation")
+            inst_action = context.instantiate_action(atom.predicate, atom.args)
+            if inst_action:
+                yield inst_action
+
+    if lazy_actions:
+        instantiated_actions = instantiate_actions()
+    else:
+        instantiated_actions = list(instantiate_actions())
+
     instantiated_goal = instantiate_goal(task.goal, init_facts, fluent_facts)
 
     return (relaxed_reachable, fluent_facts,
@@ -113,10 +142,27 @@ def instantiate(task: pddl.Task, model: Any) -> Tuple[
 
 
 def explore(task):
-    prog = pddl_to_prolog.translate(task)
-    model = build_model.compute_model(prog)
+    budget = grounding_budget.get_budget(task)
+    prog = pddl_to_prolog.translate(
+        task, relevance_analysis=options.relevance_analysis,
+        cardinality_join_order=(options.join_order == "cardinality"))
+    if options.model_profile:
+        model = build_model.compute_model(
+            prog, profile_file=options.model_profile,
+            precompute_static=options.precompute_static_relations,
+            budget=budget)
+    elif options.model_engine == "seminaive":
+        model = seminaive_model.compute_model(
+            prog, get_model_predicates(task), options.model_workers, budget)
+    else:
+        model = build_model.compute_model(
+            prog, batched=(options.model_engine == "batched"),
+            precompute_static=options.precompute_static_relations,
+            budget=budget)
     with timers.timing("Completing instantiation"):
-        return instantiate(task, model)
+        return instantiate(
+            task, model, budget,
+            lazy_actions=options.stream_operators and not options.dump_task)
 
 
 if __name__ == "__main__":
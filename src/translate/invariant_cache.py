@@ -0,0 +1,134 @@
+# invariant_cache: Reuse the results of invariant synthesis across tasks of
+# the same domain.
+#
+# Without reachable action parameters, the balance check of a candidate only
+# depends on the normalized actions of the domain. With them, the balance
+# checker adds inequality preconditions to some actions (see
+# BalanceChecker.add_inequality_preconds), which can only make more
+# candidates balanced. We store the result of each check together with the
+# inequality preconditions of the actions that threaten the candidate, and
+# reuse it for tasks with the same inequality preconditions. Invariants of
+# the domain, i.e., balanced candidates without inequality preconditions,
+# are invariants of all tasks.
+
+import hashlib
+import os
+import sys
+
+import domain_cache
+import invariants
+
+ENTRY_SUFFIX = ".invariants.pickle"
+
+
+def get_condition_key(condition):
+    if not condition.parts:
+        return (condition.__class__.__name__,
+                getattr(condition, "predicate", None),
+                getattr(condition, "args", None))
+    parameters = tuple(map(str, getattr(condition, "parameters", ())))
+    return (condition.__class__.__name__, parameters,
+            tuple(map(get_condition_key, condition.parts)))
+
+
+def get_domain_description(task, fluent_predicates):
+    predicates = [(pred.name, tuple(map(str, pred.arguments)))
+                  for pred in fluent_predicates]
+    actions = []
+    for action in task.actions:
+        effects = [(tuple(map(str, eff.parameters)),
+                    get_condition_key(eff.condition),
+                    get_condition_key(eff.literal))
+                   for eff in action.effects]
+        actions.append((tuple(map(str, action.parameters)),
+                        get_condition_key(action.precondition),
+                        tuple(effects)))
+    return repr((predicates, actions))
+
+
+def get_cache_key(task, fluent_predicates):
+    hash = hashlib.sha256()
+    hash.update(sys.version.encode())
+    for source in domain_cache.get_translator_sources():
+        domain_cache.update_hash_with_file(hash, source)
+    hash.update(get_domain_description(task, fluent_predicates).encode())
+    return hash.hexdigest()
+
+
+def get_parts(invariant):
+    return tuple((part.predicate, part.args, part.omitted_pos)
+                 for part in sorted(invariant.parts))
+
+
+def make_invariant(parts):
+    return invariants.Invariant(
+        [invariants.InvariantPart(*part) for part in parts])
+
+
+class InvariantCache:
+    """The keys of the cache are pairs of a candidate and the inequality
+    preconditions of the actions that threaten it, given as a sorted tuple of
+    triples (action index, parameter position, parameter position)."""
+    def __init__(self, cache_dir, task, fluent_predicates):
+        key = get_cache_key(task, fluent_predicates)
+        self.cache_dir = cache_dir
+        self.entry_filename = os.path.join(cache_dir, key + ENTRY_SUFFIX)
+        self.balanced_candidates = set()
+        self.refined_candidates = {}
+        self.num_reused_results = 0
+        self.changed = False
+        entry = domain_cache.load_entry(self.entry_filename)
+        if entry is not None:
+            balanced_candidate_parts, refined_candidate_parts = entry
+            self.balanced_candidates = {
+                (make_invariant(parts), inequalities)
+                for parts, inequalities in balanced_candidate_parts}
+            self.refined_candidates = {
+                (make_invariant(parts), inequalities):
+                [make_invariant(refined_parts) for refined_parts in refined]
+                for (parts, inequalities), refined in refined_candidate_parts}
+            print("Using invariant cache %s" % self.entry_filename)
+
+    def get_result(self, candidate, inequalities):
+        """Return whether the candidate is balanced and the list of its
+        refined candidates if we know them, otherwise None."""
+        if ((candidate, ()) in self.balanced_candidates or
+                (candidate, inequalities) in self.balanced_candidates):
+            result = True, []
+        elif (candidate, inequalities) in self.refined_candidates:
+            result = False, self.refined_candidates[candidate, inequalities]
+        else:
+            return None
+        self.num_reused_results += 1
+        return result
+
+    def add_result(self, candidate, inequalities, is_balanced,
+                   refined_candidates):
+        if is_balanced:
+            self.balanced_candidates.add((candidate, inequalities))
+        else:
+            self.refined_candidates[candidate, inequalities] = list(
+                refined_candidates)
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        balanced_candidate_parts = {
+            (get_parts(candidate), inequalities)
+            for candidate, inequalities in self.balanced_candidates}
+        refined_candidate_parts = {
+            (get_parts(candidate), inequalities):
+            [get_parts(refined) for refined in refined]
+            for (candidate, inequalities), refined
+            in self.refined_candidates.items()}
+        # Keep what other translator runs added in the meantime.
+        entry = domain_cache.load_entry(self.entry_filename)
+        if entry is not None:
+            balanced_candidate_parts.update(entry[0])
+            for key, refined in entry[1]:
+                refined_candidate_parts.setdefault(key, refined)
+        entry = (sorted(balanced_candidate_parts),
+                 sorted(refined_candidate_parts.items()))
+        domain_cache.store_entry(self.cache_dir, self.entry_filename, entry)
+        self.changed = False
@@ -1,24 +1,40 @@
 #! /usr/bin/env python3
 
 
-from collections import deque, defaultdict
+from collections import Counter, deque, defaultdict
+import heapq
 import itertools
+import multiprocessing
 import random
+import sys
 import time
 from typing import List
 
+import invariant_cache
 import invariants
 import options
 import pddl
 import timers
 
+# Number of candidates each worker checks at a time in parallel invariant
+# generation.
+BATCH_SIZE = 100
+
+# Wall-clock seconds between two progress reports of invariant generation.
+PROGRESS_INTERVAL = 10
+
 class BalanceChecker:
     def __init__(self, task, reachable_action_params):
         self.predicates_to_add_actions = defaultdict(list)
-        self.random = random.Random(314159)
+        self.seed = 314159
         self.action_to_heavy_action = {}
-        for act in task.actions:
-            action = self.add_inequality_preconds(act, reachable_action_params)
+        # Maps predicates to the inequality preconditions of the actions
+        # that add them, as triples (action index, position, position).
+        self.predicate_to_inequalities = defaultdict(set)
+        for action_index, act in enumerate(task.actions):
+            inequal_params = self.get_inequal_params(
+                act, reachable_action_params)
+            action = self.add_inequality_preconds(act, inequal_params)
             too_heavy_effects = []
             create_heavy_act = False
             heavy_act = action
@@ -32,6 +48,9 @@ class BalanceChecker:
                     add_actions = self.predicates_to_add_actions[predicate]
                     if not add_actions or add_actions[-1] is not action:
                         add_actions.append(action)
+                    self.predicate_to_inequalities[predicate].update(
+                        (action_index, pos1, pos2)
+                        for pos1, pos2 in inequal_params)
             if create_heavy_act:
                 heavy_act = pddl.Action(action.name, action.parameters,
                                         action.num_external_parameters,
@@ -47,9 +66,23 @@ class BalanceChecker:
     def get_heavy_action(self, action):
         return self.action_to_heavy_action[action]
 
-    def add_inequality_preconds(self, action, reachable_action_params):
+    def get_inequalities(self, invariant):
+        """Return the inequality preconditions of the actions that threaten
+        the invariant as a sorted tuple."""
+        inequalities = set()
+        for predicate in invariant.predicates:
+            inequalities.update(self.predicate_to_inequalities.get(predicate, ()))
+        return tuple(sorted(inequalities))
+
+    def get_random(self, invariant):
+        # The order in which the actions are checked only depends on the
+        # candidate, so that the invariants we find do not depend on the
+        # order (or the process) in which the candidates are checked.
+        return random.Random("%d %s" % (self.seed, invariant))
+
+    def get_inequal_params(self, action, reachable_action_params):
         if reachable_action_params is None or len(action.parameters) < 2:
-            return action
+            return []
         inequal_params = []
         combs = itertools.combinations(range(len(action.parameters)), 2)
         for pos1, pos2 in combs:
@@ -58,7 +91,9 @@ class BalanceChecker:
                     break
             else:
                 inequal_params.append((pos1, pos2))
+        return inequal_params
 
+    def add_inequality_preconds(self, action, inequal_params):
         if inequal_params:
             precond_parts = [action.precondition]
             for pos1, pos2 in inequal_params:
@@ -73,6 +108,32 @@ class BalanceChecker:
         else:
             return action
 
+class CachedBalanceChecks:
+    """Look up and store the results of balance checks in an invariant
+    cache."""
+    def __init__(self, task, balance_checker, cache):
+        self.task = task
+        self.balance_checker = balance_checker
+        self.cache = cache
+        self.domain_balance_checker = None
+
+    def get_result(self, candidate):
+        return self.cache.get_result(
+            candidate, self.balance_checker.get_inequalities(candidate))
+
+    def add_result(self, candidate, is_balanced, refined_candidates):
+        inequalities = self.balance_checker.get_inequalities(candidate)
+        self.cache.add_result(
+            candidate, inequalities, is_balanced, refined_candidates)
+        if is_balanced and inequalities:
+            # Check whether the candidate is also an invariant of the domain,
+            # so that we can reuse the result for all tasks.
+            if self.domain_balance_checker is None:
+                self.domain_balance_checker = BalanceChecker(self.task, None)
+            if candidate.check_balance(self.domain_balance_checker,
+                                       lambda invariant: None):
+                self.cache.add_result(candidate, (), True, [])
+
 def get_fluents(task):
     fluent_names = set()
     for action in task.actions:
@@ -91,11 +152,291 @@ def get_initial_invariants(task):
             part = invariants.InvariantPart(predicate.name, inv_args, omitted)
             yield invariants.Invariant((part,))
 
-def find_invariants(task, reachable_action_params):
+def check_candidates(candidates, balance_checker):
+    """Return for each candidate whether it is balanced and the list of
+    refined candidates it produced."""
+    results = []
+    for candidate in candidates:
+        refined_candidates = []
+        is_balanced = candidate.check_balance(
+            balance_checker, refined_candidates.append)
+        results.append((is_balanced, refined_candidates))
+    return results
+
+def run_worker(balance_checker, connection):
+    while True:
+        candidates = connection.recv()
+        if candidates is None:
+            break
+        connection.send(check_candidates(candidates, balance_checker))
+    connection.close()
+
+class SearchProgress:
+    """Check the time limits of invariant generation and periodically report
+    its progress. The max time is CPU time of the main process, or wall-clock
+    time with use_wall_clock. The max wall time always is wall-clock time."""
+    def __init__(self, use_wall_clock):
+        self.use_wall_clock = use_wall_clock
+        self.start_time = self.get_time()
+        self.start_wall_clock_time = time.perf_counter()
+        self.next_report_time = self.start_wall_clock_time + PROGRESS_INTERVAL
+        self.num_checked = 0
+        self.num_balanced = 0
+
+    def get_time(self):
+        if self.use_wall_clock:
+            return time.perf_counter()
+        return time.process_time()
+
+    def time_limit_reached(self):
+        max_wall_time = options.invariant_generation_max_wall_time
+        if (self.get_time() - self.start_time >
+                options.invariant_generation_max_time or
+                max_wall_time is not None and
+                time.perf_counter() - self.start_wall_clock_time >
+                max_wall_time):
+            print("Time limit reached, aborting invariant generation")
+            return True
+        return False
+
+    def add_result(self, is_balanced, num_queued):
+        self.num_checked += 1
+        self.num_balanced += is_balanced
+        now = time.perf_counter()
+        if now >= self.next_report_time:
+            print("Checked %d invariant candidates, found %d invariants, "
+                  "%d candidates in queue [%.3fs wall-clock]" % (
+                      self.num_checked, self.num_balanced, num_queued,
+                      now - self.start_wall_clock_time))
+            sys.stdout.flush()
+            self.next_report_time = now + PROGRESS_INTERVAL
+
+class UsefulnessEstimator:
+    """Estimate how useful a candidate would be if it were an invariant,
+    following useful_groups: every group with exactly one initial atom saves
+    one variable per additional reachable atom in the group. Ties are broken
+    by the number of goal atoms the candidate covers."""
+    def __init__(self, task, atoms=None):
+        if atoms is None:
+            atoms = [atom for atom in task.init
+                     if not isinstance(atom, pddl.Assign)]
+        self.reachable_atoms = self.get_atoms_by_predicate(atoms)
+        self.initial_atoms = self.get_atoms_by_predicate(
+            atom for atom in task.init if not isinstance(atom, pddl.Assign))
+        if isinstance(task.goal, pddl.Conjunction):
+            goal_literals = task.goal.parts
+        else:
+            goal_literals = [task.goal]
+        self.goal_atoms = self.get_atoms_by_predicate(
+            literal for literal in goal_literals
+            if isinstance(literal, pddl.Atom))
+        self.part_counts = {}
+
+    def get_atoms_by_predicate(self, atoms):
+        result = defaultdict(list)
+        for atom in atoms:
+            result[atom.predicate].append(atom)
+        return result
+
+    def get_part_counts(self, part):
+        """Return the number of reachable, initial and goal atoms of the part
+        for each instantiation of the invariant parameters."""
+        counts = self.part_counts.get(part)
+        if counts is None:
+            counts = tuple(
+                self.count_parameters(part, atoms_by_predicate)
+                for atoms_by_predicate in (self.reachable_atoms,
+                                           self.initial_atoms,
+                                           self.goal_atoms))
+            self.part_counts[part] = counts
+        return counts
+
+    def count_parameters(self, part, atoms_by_predicate):
+        result = Counter()
+        for atom in atoms_by_predicate.get(part.predicate, ()):
+            parameters = part.get_parameters(atom)
+            result[tuple(parameters[var] for var in range(part.arity()))] += 1
+        return result
+
+    def get_priority(self, candidate):
+        reachable = Counter()
+        initial = Counter()
+        num_goal_atoms = 0
+        for part in candidate.parts:
+            part_reachable, part_initial, part_goal = self.get_part_counts(part)
+            reachable.update(part_reachable)
+            initial.update(part_initial)
+            num_goal_atoms += sum(part_goal.values())
+        saved_variables = sum(reachable[parameters] - 1
+                              for parameters, count in initial.items()
+                              if count == 1)
+        return (-saved_variables, -num_goal_atoms)
+
+class PriorityQueue:
+    """Queue of candidates ordered by the given priority function (smaller
+    is better), with the same interface as the deque of the FIFO order.
+    Candidates with the same priority are ordered FIFO. A candidate that is
+    appended again keeps its original position in the order."""
+    def __init__(self, get_priority):
+        self.get_priority = get_priority
+        self.heap = []
+        self.counter = itertools.count()
+        self.keys = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def append(self, candidate):
+        key = self.keys.get(candidate)
+        if key is None:
+            key = (self.get_priority(candidate), next(self.counter))
+            self.keys[candidate] = key
+        heapq.heappush(self.heap, (key, candidate))
+
+    def popleft(self):
+        return heapq.heappop(self.heap)[-1]
+
+    def precedes(self, candidate):
+        """Test if the first candidate in the queue comes before the given
+        candidate, which must have been appended before."""
+        return bool(self.heap) and self.heap[0][0] < self.keys[candidate]
+
+def can_check_in_parallel():
+    # The workers inherit the balance checker instead of unpickling it.
+    return "fork" in multiprocessing.get_all_start_methods()
+
+def check_sequentially(candidates, enqueue_func, balance_checker,
+                       cached_checks=None):
+    """Check the candidates in the queue and yield the balanced ones. With
+    cached_checks, reuse and store the results of the checks."""
+    progress = SearchProgress(use_wall_clock=False)
+    while candidates:
+        candidate = candidates.popleft()
+        if progress.time_limit_reached():
+            return
+        result = None
+        if cached_checks is not None:
+            result = cached_checks.get_result(candidate)
+        if result is None:
+            refined_candidates = []
+            is_balanced = candidate.check_balance(
+                balance_checker, refined_candidates.append)
+            if cached_checks is not None:
+                cached_checks.add_result(
+                    candidate, is_balanced, refined_candidates)
+        else:
+            is_balanced, refined_candidates = result
+        for refined_candidate in refined_candidates:
+            enqueue_func(refined_candidate)
+        progress.add_result(is_balanced, len(candidates))
+        if is_balanced:
+            yield candidate
+
+def check_in_parallel(candidates, enqueue_func, balance_checker, num_workers,
+                      cached_checks=None):
+    """Like check_sequentially, but let num_workers worker processes check
+    the candidates in the queue in batches. We process the results in queue
+    order, so we enqueue the refined candidates in the same order as a
+    single process. With a priority queue, a refined candidate can come
+    before the rest of the batch. Then we put the rest of the batch back
+    into the queue and keep their results for later."""
+    context = multiprocessing.get_context("fork")
+    # Otherwise, the workers would print buffered output a second time.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    connections = []
+    workers = []
+    for _ in range(num_workers):
+        connection, worker_connection = context.Pipe()
+        worker = context.Process(
+            target=run_worker, args=(balance_checker, worker_connection),
+            daemon=True)
+        worker.start()
+        worker_connection.close()
+        connections.append(connection)
+        workers.append(worker)
+    try:
+        # The main process mostly waits for the workers, so we limit the
+        # wall-clock time.
+        progress = SearchProgress(use_wall_clock=True)
+        prioritized = isinstance(candidates, PriorityQueue)
+        # Results of candidates that were put back into the queue.
+        put_back_results = {}
+        # Whether the workers may still be checking candidates.
+        workers_busy = False
+        while candidates:
+            if progress.time_limit_reached():
+                return
+            batch_size = min(len(candidates), num_workers * BATCH_SIZE)
+            batch = [candidates.popleft() for _ in range(batch_size)]
+            results = [put_back_results.pop(candidate, None)
+                       for candidate in batch]
+            if cached_checks is not None:
+                results = [cached_checks.get_result(candidate)
+                           if result is None else result
+                           for candidate, result in zip(batch, results)]
+            # Positions of the candidates the workers need to check.
+            unchecked = [pos for pos, result in enumerate(results)
+                         if result is None]
+            chunk_size = max(1, -(-len(unchecked) // num_workers))
+            chunks = [unchecked[start:start + chunk_size]
+                      for start in range(0, len(unchecked), chunk_size)]
+            workers_busy = True
+            for connection, chunk in zip(connections, chunks):
+                connection.send([batch[pos] for pos in chunk])
+            for connection, chunk in zip(connections, chunks):
+                for pos, result in zip(chunk, connection.recv()):
+                    results[pos] = result
+                    if cached_checks is not None:
+                        cached_checks.add_result(batch[pos], *result)
+            workers_busy = False
+            for pos, candidate in enumerate(batch):
+                if prioritized and candidates.precedes(candidate):
+                    for later_candidate, result in zip(
+                            batch[pos:], results[pos:]):
+                        put_back_results[later_candidate] = result
+                        candidates.append(later_candidate)
+                    break
+                is_balanced, refined_candidates = results[pos]
+                for refined_candidate in refined_candidates:
+                    enqueue_func(refined_candidate)
+                progress.add_result(is_balanced, len(candidates))
+                if is_balanced:
+                    yield candidate
+    finally:
+        # Workers that are still checking candidates after an error would
+        # only send their results to a closed connection.
+        if workers_busy:
+            for worker in workers:
+                worker.terminate()
+        for connection in connections:
+            if not workers_busy:
+                try:
+                    connection.send(None)
+                except (BrokenPipeError, OSError):
+                    # The worker has died, e.g., because it ran out of
+                    # memory. Do not hide the original exception.
+                    pass
+            connection.close()
+        for worker in workers:
+            worker.join()
+
+def find_invariants(task, reachable_action_params, atoms=None):
+    """With the priority order, check the candidates in the order of their
+    estimated usefulness for the given reachable atoms (default: the initial
+    state)."""
     limit = options.invariant_generation_max_candidates
-    candidates = deque(itertools.islice(get_initial_invariants(task), 0, limit))
+    initial_candidates = list(
+        itertools.islice(get_initial_invariants(task), 0, limit))
+    if options.invariant_generation_order == "priority":
+        estimator = UsefulnessEstimator(task, atoms)
+        candidates = PriorityQueue(estimator.get_priority)
+        for candidate in initial_candidates:
+            candidates.append(candidate)
+    else:
+        candidates = deque(initial_candidates)
     print(len(candidates), "initial candidates")
-    seen_candidates = set(candidates)
+    seen_candidates = set(initial_candidates)
 
     balance_checker = BalanceChecker(task, reachable_action_params)
 
@@ -104,14 +445,32 @@ def find_invariants(task, reachable_action_params):
             candidates.append(invariant)
             seen_candidates.add(invariant)
 
-    start_time = time.process_time()
-    while candidates:
-        candidate = candidates.popleft()
-        if time.process_time() - start_time > options.invariant_generation_max_time:
-            print("Time limit reached, aborting invariant generation")
-            return
-        if candidate.check_balance(balance_checker, enqueue_func):
-            yield candidate
+    cache = None
+    cached_checks = None
+    if options.invariant_cache:
+        cache = invariant_cache.InvariantCache(
+            options.invariant_cache, task, get_fluents(task))
+        cached_checks = CachedBalanceChecks(task, balance_checker, cache)
+
+    num_workers = options.invariant_generation_workers
+    if num_workers > 1 and not can_check_in_parallel():
+        print("Parallel invariant generation is not supported on this "
+              "platform. Using a single process.")
+        num_workers = 1
+    try:
+        if num_workers > 1:
+            print("Using %d worker processes." % num_workers)
+            yield from check_in_parallel(
+                candidates, enqueue_func, balance_checker, num_workers,
+                cached_checks)
+        else:
+            yield from check_sequentially(
+                candidates, enqueue_func, balance_checker, cached_checks)
+    finally:
+        if cache is not None:
+            print("Reused %d results from the invariant cache" %
+                  cache.num_reused_results)
+            cache.save()
 
 def useful_groups(invariants, initial_facts):
     predicate_to_invariants = defaultdict(list)
@@ -142,9 +501,11 @@ def useful_groups(invariants, initial_facts):
         yield [part.instantiate(parameters) for part in sorted(invariant.parts)]
 
 # returns a list of mutex groups (parameters instantiated, counted variables not)
-def get_groups(task, reachable_action_params=None) -> List[List[pddl.Atom]]:
+def get_groups(task, reachable_action_params=None,
+               atoms=None) -> List[List[pddl.Atom]]:
     with timers.timing("Finding invariants", block=True):
-        invariants = list(find_invariants(task, reachable_action_params))
+        invariants = list(find_invariants(
+            task, reachable_action_params, atoms))
     with timers.timing("Checking invariant weight"):
         result = list(useful_groups(invariants, task.init))
     return result
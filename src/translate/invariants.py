@@ -327,13 +327,14 @@ class Invariant:
                 actions_to_check[a] = True
 
         actions = list(actions_to_check.keys())
+        rng = balance_checker.get_random(self)
         while actions:
             # For a better expected perfomance, we want to randomize the order
             # in which actions are checked. Since candidates are often already
             # discarded by an early check, we do not want to shuffle the order
             # but instead always draw the next action randomly from those we
             # did not yet consider.
-            pos = balance_checker.random.randrange(len(actions))
+            pos = rng.randrange(len(actions))
             actions[pos], actions[-1] = actions[-1], actions[pos]
             action = actions.pop()
             heavy_action = balance_checker.get_heavy_action(action)
@@ -0,0 +1,197 @@
+# magic_sets: Goal-directed relevance analysis for the exploration program.
+#
+# The exploration program derives all relaxed reachable atoms and actions,
+# many of which cannot contribute to reaching the goal. We rewrite the
+# (normalized, but not yet split) program with the magic sets technique,
+# using @goal-reachable as the query, such that only relevant atoms are
+# derived:
+#
+# - An adornment of a derived predicate records which of its arguments are
+#   bound when the predicate is requested. For each requested pair of
+#   predicate and adornment, there is a "magic" predicate whose atoms are
+#   the requested bindings.
+# - Each rule "H :- B1, ..., Bn" is guarded by the magic atom of its head,
+#   and each derived body atom Bi is requested with the bindings that the
+#   magic atom and the body atoms connected to it provide.
+#
+# Rules for action effects stay unguarded, so that the model contains all
+# effects of all derived actions, which instantiate relies on. Since the
+# exploration program ignores negative conditions and delete effects, all
+# atoms of predicates occurring in negative conditions are requested
+# unconditionally, as are all actions that delete such atoms and the
+# conditions of these delete effects. Everything that remains in the model
+# is relaxed reachable, and every action that can occur in a plan of the
+# task is contained in the model.
+
+from collections import defaultdict, deque
+
+import pddl
+import pddl_to_prolog
+
+
+def is_variable(arg):
+    return arg[0] == "?"
+
+
+def collect_atoms(condition, result):
+    if isinstance(condition, pddl.Literal):
+        result.append(condition)
+    else:
+        for part in condition.parts:
+            collect_atoms(part, result)
+
+
+def get_negative_condition_predicates(task):
+    literals = []
+    for action in task.actions:
+        collect_atoms(action.precondition, literals)
+        for effect in action.effects:
+            collect_atoms(effect.condition, literals)
+    for axiom in task.axioms:
+        collect_atoms(axiom.condition, literals)
+    collect_atoms(task.goal, literals)
+    return {literal.predicate for literal in literals if literal.negated}
+
+
+def get_unconditionally_relevant_predicates(task):
+    """Return the predicates (including actions) whose reachable atoms must
+    all be derived because the exploration program does not see how they
+    can matter: predicates occurring in negative conditions, actions
+    deleting atoms of such predicates and predicates in the conditions of
+    these delete effects."""
+    negative_predicates = get_negative_condition_predicates(task)
+    result = list(negative_predicates)
+    for action in task.actions:
+        for effect in action.effects:
+            if (effect.literal.negated and
+                    effect.literal.predicate in negative_predicates):
+                result.append(action)
+                atoms = []
+                collect_atoms(effect.condition, atoms)
+                result.extend(atom.predicate for atom in atoms
+                              if not atom.negated)
+    return result
+
+
+class MagicProgram:
+    def __init__(self, rules, name_generator):
+        self.rules_by_head = defaultdict(list)
+        for rule in rules:
+            self.rules_by_head[rule.effect.predicate].append(rule)
+        self.name_generator = name_generator
+        self.magic_predicates = {}
+        self.queue = deque()
+        self.new_rules = []
+        self.unguarded_rules = set()
+
+    def is_derived(self, predicate):
+        return predicate in self.rules_by_head
+
+    def get_arity(self, predicate):
+        return len(self.rules_by_head[predicate][0].effect.args)
+
+    def request(self, atom, adornment):
+        """Return the magic atom for the given atom and adornment (a tuple
+        of Booleans that says which arguments are bound)."""
+        key = (atom.predicate, adornment)
+        name = self.magic_predicates.get(key)
+        if name is None:
+            name = next(self.name_generator)
+            self.magic_predicates[key] = name
+            self.queue.append(key)
+        bound_args = [arg for arg, bound in zip(atom.args, adornment)
+                      if bound]
+        return pddl.Atom(name, bound_args)
+
+    def request_all(self, predicate):
+        adornment = (False,) * self.get_arity(predicate)
+        return self.request(pddl.Atom(predicate, []), adornment)
+
+    def rewrite(self):
+        while self.queue:
+            predicate, adornment = self.queue.popleft()
+            for rule in self.rules_by_head[predicate]:
+                self.rewrite_rule(rule, adornment)
+        return self.new_rules
+
+    def rewrite_rule(self, rule, adornment):
+        magic_atom = self.request(rule.effect, adornment)
+        bound_vars = {arg for arg in magic_atom.args if is_variable(arg)}
+        # Pairs of conditions and the variables they bind first.
+        binding_conds = []
+        for cond in self.get_sips_order(rule, bound_vars):
+            if self.is_derived(cond.predicate):
+                cond_adornment = tuple(not is_variable(arg) or arg in bound_vars
+                                       for arg in cond.args)
+                cond_magic_atom = self.request(cond, cond_adornment)
+                conditions = [magic_atom] + self.get_needed_conditions(
+                    binding_conds, cond_magic_atom)
+                self.new_rules.append(pddl_to_prolog.Rule(
+                    conditions, cond_magic_atom, rule.origin))
+            new_vars = {arg for arg in cond.args
+                        if is_variable(arg) and arg not in bound_vars}
+            if new_vars:
+                binding_conds.append((cond, new_vars))
+                bound_vars |= new_vars
+        if any(isinstance(cond.predicate, pddl.Action)
+               for cond in rule.conditions):
+            # Effect rules are not guarded (see above).
+            if rule not in self.unguarded_rules:
+                self.unguarded_rules.add(rule)
+                self.new_rules.append(pddl_to_prolog.Rule(
+                    list(rule.conditions), rule.effect, rule.origin))
+        else:
+            self.new_rules.append(pddl_to_prolog.Rule(
+                [magic_atom] + rule.conditions, rule.effect, rule.origin))
+
+    def get_sips_order(self, rule, bound_vars):
+        """Order the conditions of the rule for passing bindings from the
+        head to the body ("sideways information passing"). We prefer
+        conditions that share a variable with the variables bound so far
+        and among those static ones. Static conditions without such a
+        variable come last, because they would only contribute cross
+        products of bindings."""
+        bound_vars = set(bound_vars)
+        remaining = list(rule.conditions)
+        result = []
+        while remaining:
+            def priority(cond):
+                connected = any(arg in bound_vars for arg in cond.args)
+                derived = self.is_derived(cond.predicate)
+                return (connected, connected and not derived, derived)
+            cond = max(remaining, key=priority)
+            if priority(cond) == (False, False, False):
+                result.extend(remaining)
+                break
+            remaining.remove(cond)
+            result.append(cond)
+            bound_vars.update(arg for arg in cond.args if is_variable(arg))
+        return result
+
+    def get_needed_conditions(self, binding_conds, target):
+        """Return the conditions among binding_conds that are needed to
+        bind the variables of target."""
+        needed_vars = {arg for arg in target.args if is_variable(arg)}
+        result = []
+        for cond, new_vars in reversed(binding_conds):
+            if new_vars & needed_vars:
+                result.append(cond)
+                needed_vars |= {arg for arg in cond.args if is_variable(arg)}
+        result.reverse()
+        return result
+
+
+def rewrite(prog, task):
+    """Rewrite the normalized program prog such that it only derives atoms
+    that are relevant for reaching the goal."""
+    magic_program = MagicProgram(prog.rules, prog.new_name)
+    seeds = [magic_program.request(pddl.Atom("@goal-reachable", []), ())]
+    for predicate in get_unconditionally_relevant_predicates(task):
+        if magic_program.is_derived(predicate):
+            seeds.append(magic_program.request_all(predicate))
+    num_rules = len(prog.rules)
+    prog.rules = magic_program.rewrite()
+    for atom in seeds:
+        prog.add_fact(atom)
+    print("Relevance analysis: rewrote %d rules into %d rules." % (
+        num_rules, len(prog.rules)))
@@ -40,6 +40,8 @@ class PreconditionProxy(ConditionProxy):
         rules.append((rule_body, rule_head))
     def get_type_map(self):
         return self.owner.type_map
+    def get_description(self):
+        return "precondition of action %s" % self.owner.name
 
 class EffectConditionProxy(ConditionProxy):
     def __init__(self, action, effect):
@@ -61,6 +63,8 @@ class EffectConditionProxy(ConditionProxy):
             rules.append((rule_body, rule_head))
     def get_type_map(self):
         return self.action.type_map
+    def get_description(self):
+        return "effect condition of action %s" % self.action.name
 
 class AxiomConditionProxy(ConditionProxy):
     def __init__(self, axiom):
@@ -83,6 +87,8 @@ class AxiomConditionProxy(ConditionProxy):
         rules.append((eff_rule_body, eff_rule_head))
     def get_type_map(self):
         return self.owner.type_map
+    def get_description(self):
+        return "axiom %s" % self.owner.name
 
 class GoalConditionProxy(ConditionProxy):
     def __init__(self, task):
@@ -115,6 +121,8 @@ class GoalConditionProxy(ConditionProxy):
         type_map = {}
         self.condition.uniquify_variables(type_map)
         return type_map
+    def get_description(self):
+        return "goal"
 
 def get_action_predicate(action):
     name = action
@@ -142,6 +150,12 @@ def all_conditions(task):
         yield AxiomConditionProxy(axiom)
     yield GoalConditionProxy(task)
 
+# [0] With hash-consing, share equal subconditions of the parsed task, so
+#     that the following steps transform them only once.
+def share_equal_conditions(task):
+    for proxy in all_conditions(task):
+        proxy.set(pddl.canonical_condition(proxy.condition))
+
 # [1] Remove universal quantifications from conditions.
 #
 # Replace, in a top-down fashion, <forall(vars, phi)> by <not(not-all-phi)>,
@@ -183,7 +197,28 @@ def remove_universal_quantifiers(task):
 # (1) or(phi, or(psi, psi'))      ==  or(phi, psi, psi')
 # (2) exists(vars, or(phi, psi))  ==  or(exists(vars, phi), exists(vars, psi))
 # (3) and(phi, or(psi, psi'))     ==  or(and(phi, psi), and(phi, psi'))
-def build_DNF(task):
+#
+# The DNF can be exponentially larger than the condition. If it would have
+# more than max_dnf_size disjuncts, we first replace the disjunctive
+# subconditions below the outermost disjunction by new axioms, whose
+# conditions are normalized in turn. Afterwards, the DNF has one disjunct for
+# each part of the outermost disjunction.
+def estimate_dnf_size(condition):
+    """Return the number of disjuncts of the DNF that build_DNF computes
+    for the condition, before simplification."""
+    if isinstance(condition, pddl.Disjunction):
+        return sum(estimate_dnf_size(part) for part in condition.parts)
+    result = 1
+    for part in condition.parts:
+        result *= estimate_dnf_size(part)
+    return result
+
+def count_outermost_disjuncts(condition):
+    if isinstance(condition, pddl.Disjunction):
+        return sum(count_outermost_disjuncts(part) for part in condition.parts)
+    return 1
+
+def build_DNF(task, max_dnf_size=None):
     def recurse(condition):
         disjunctive_parts = []
         other_parts = []
@@ -221,10 +256,50 @@ def build_DNF(task):
                 for part2 in parts_to_distribute:
                     result_parts.append(pddl.Conjunction((part1, part2)))
         return pddl.Disjunction(result_parts)
+    recurse = pddl.memoize_transformation(recurse)
 
-    for proxy in all_conditions(task):
+    def factor_disjunctions(condition):
+        # Uses type_map from surrounding scope.
+        if isinstance(condition, pddl.Disjunction):
+            return condition.change_parts(
+                [factor_disjunctions(part) for part in condition.parts])
+        new_parts = []
+        for part in condition.parts:
+            if isinstance(part, pddl.Disjunction):
+                part = get_axiom_atom(part)
+            elif part.has_disjunction():
+                part = factor_disjunctions(part)
+            new_parts.append(part)
+        return condition.change_parts(new_parts)
+
+    def get_axiom_atom(condition):
+        # Uses new_axioms_by_condition, proxies and type_map from
+        # surrounding scope.
+        parameters = sorted(condition.free_variables())
+        typed_parameters = tuple(pddl.TypedObject(v, type_map[v]) for v in parameters)
+        axiom = new_axioms_by_condition.get((condition, typed_parameters))
+        if not axiom:
+            axiom = task.add_axiom(list(typed_parameters), condition)
+            new_axioms_by_condition[(condition, typed_parameters)] = axiom
+            proxies.append(AxiomConditionProxy(axiom))
+        return pddl.Atom(axiom.name, parameters)
+
+    new_axioms_by_condition = {}
+    # We append the conditions of new axioms while iterating.
+    proxies = list(all_conditions(task))
+    for proxy in proxies:
         if proxy.condition.has_disjunction():
-            proxy.set(recurse(proxy.condition).simplified())
+            condition = proxy.condition
+            if max_dnf_size is not None:
+                dnf_size = estimate_dnf_size(condition)
+                if (dnf_size > max_dnf_size and
+                        dnf_size > count_outermost_disjuncts(condition)):
+                    print("DNF of %s would have %d disjuncts; introducing "
+                          "axioms for its disjunctive subconditions" %
+                          (proxy.get_description(), dnf_size))
+                    type_map = proxy.get_type_map()
+                    condition = factor_disjunctions(condition)
+            proxy.set(recurse(condition).simplified())
 
 # [3] Split conditions at the outermost disjunction.
 def split_disjunctions(task):
@@ -272,6 +347,7 @@ def move_existential_quantifiers(task):
             new_conjunction_parts += part.parts
         new_conjunction = pddl.Conjunction(new_conjunction_parts)
         return pddl.ExistentialCondition(new_parameters, (new_conjunction,))
+    recurse = pddl.memoize_transformation(recurse)
 
     for proxy in all_conditions(task):
         if proxy.condition.has_existential_part():
@@ -340,10 +416,11 @@ def substitute_complicated_goal(task):
 # Combine Steps [1], [2], [3], [4], [5] and do some additional verification
 # that the task makes sense.
 
-def normalize(task):
+def normalize(task, max_dnf_size=None):
+    share_equal_conditions(task)
     remove_universal_quantifiers(task)
     substitute_complicated_goal(task)
-    build_DNF(task)
+    build_DNF(task, max_dnf_size)
     split_disjunctions(task)
     move_existential_quantifiers(task)
     eliminate_existential_quantifiers_from_axioms(task)
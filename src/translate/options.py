@@ -31,6 +31,33 @@ def parse_args():
     argparser.add_argument(
         "--invariant-generation-max-time", default=300, type=int,
         help="max time for invariant generation (default: %(default)ds)")
+    argparser.add_argument(
+        "--invariant-generation-max-wall-time", type=float, metavar="SECONDS",
+        help="max wall-clock time for invariant generation. Invariant "
+        "generation stops with the invariants found so far when it is "
+        "exceeded (default: no limit)")
+    argparser.add_argument(
+        "--invariant-generation-order", choices=["fifo", "priority"],
+        default="fifo",
+        help="order in which invariant candidates are checked. With "
+        "priority, candidates that would produce larger mutex groups of "
+        "reachable atoms, and then candidates covering more goal atoms, are "
+        "checked first, so that the most useful invariants are likely "
+        "found before a time or candidate limit is reached "
+        "(default: %(default)s)")
+    argparser.add_argument(
+        "--invariant-cache", metavar="DIR",
+        help="cache the invariants of the domain and the refinements of "
+        "rejected invariant candidates in DIR, keyed by a hash of the "
+        "normalized domain, and reuse them for tasks of the same domain. "
+        "Candidates that depend on the reachable action parameters of the "
+        "task are checked again.")
+    argparser.add_argument(
+        "--invariant-generation-workers", default=1, type=int, metavar="N",
+        help="number of worker processes for checking invariant candidates. "
+        "The invariants found do not depend on the number of workers. With "
+        "more than one worker, the max time for invariant generation is "
+        "wall-clock time (default: %(default)d)")
     argparser.add_argument(
         "--add-implied-preconditions", action="store_true",
         help="infer additional preconditions. This setting can cause a "
@@ -49,6 +76,104 @@ def parse_args():
         "--keep-unimportant-variables",
         dest="filter_unimportant_vars", action="store_false",
         help="keep variables that do not influence the goal in the causal graph")
+    argparser.add_argument(
+        "--model-engine", default="queue",
+        choices=["queue", "batched", "seminaive"],
+        help="algorithm for computing the relaxed reachability model. "
+        "'queue' processes one atom at a time. 'batched' computes the same "
+        "model, but lets each rule process a batch of atoms at once. "
+        "'seminaive' uses "
+        "integer-encoded semi-naive evaluation, which needs less time and "
+        "memory on large tasks (default: %(default)s)")
+    argparser.add_argument(
+        "--model-workers", default=1, type=int, metavar="N",
+        help="number of worker processes for computing the model with the "
+        "'seminaive' engine. The work of each rule is partitioned by hashing "
+        "its join keys. The result does not depend on the number of "
+        "workers (default: %(default)d)")
+    argparser.add_argument(
+        "--relevance-analysis", action="store_true",
+        help="only ground atoms and actions that are relevant for reaching "
+        "the goal, using a magic sets rewrite of the exploration program. "
+        "This can considerably reduce the grounding effort for tasks with "
+        "large irrelevant parts.")
+    argparser.add_argument(
+        "--join-order", default="variables",
+        choices=["variables", "cardinality"],
+        help="how to split the rules of the exploration program into binary "
+        "joins. 'variables' greedily joins the conditions that share the "
+        "most variables. 'cardinality' joins the conditions with the "
+        "smallest estimated result size first, based on the number of "
+        "(static) facts per predicate and argument "
+        "(default: %(default)s)")
+    argparser.add_argument(
+        "--precompute-static-relations", action="store_true",
+        help="compute the relations of static predicates (and of auxiliary "
+        "predicates that only depend on them) before the main exploration "
+        "and store them in the join indices of the remaining rules, so that "
+        "static atoms are not processed again. Only affects the 'queue' and "
+        "'batched' model engines.")
+    argparser.add_argument(
+        "--grounding-max-atoms", type=int, metavar="N",
+        help="abort grounding with exit code 25 if the model of the "
+        "exploration program has more than N atoms")
+    argparser.add_argument(
+        "--grounding-max-actions", type=int, metavar="N",
+        help="abort grounding with exit code 25 if more than N actions are "
+        "reachable")
+    argparser.add_argument(
+        "--grounding-max-memory", type=int, metavar="MB",
+        help="abort grounding with exit code 25 if the translator uses more "
+        "than MB MiB of memory")
+    argparser.add_argument(
+        "--grounding-report", metavar="FILE",
+        help="if grounding is aborted, write a JSON report of the ground "
+        "size of each action schema to FILE")
+    argparser.add_argument(
+        "--model-profile", metavar="FILE",
+        help="write statistics about the time spent in and the atoms "
+        "produced by each rule of the exploration program to FILE in JSON "
+        "format. Profiling always uses the 'queue' model engine.")
+    argparser.add_argument(
+        "--propositional-fast-path", action="store_true",
+        help="translate tasks whose actions and predicates have no "
+        "parameters with direct forward reachability and mutex detection "
+        "on the ground actions instead of with the Datalog exploration and "
+        "the lifted invariant synthesis. The mutex groups can differ from "
+        "the default ones. Ignored with --relevance-analysis.")
+    argparser.add_argument(
+        "--stream-operators", action="store_true",
+        help="instantiate the actions one at a time while translating them "
+        "to SAS operators and keep the operators in a temporary file instead "
+        "of in memory. This reduces the peak memory usage for tasks with "
+        "many operators. Ignored with --dump-task.")
+    argparser.add_argument(
+        "--max-dnf-size", type=int, metavar="N",
+        help="if the disjunctive normal form of a condition would have more "
+        "than N disjuncts, replace its disjunctive subconditions by new "
+        "axioms instead of multiplying them out. Without a limit, all "
+        "conditions are multiplied out (default: no limit)")
+    argparser.add_argument(
+        "--hash-cons-conditions", action="store_true",
+        help="share equal subconditions and memoize the transformations of "
+        "conditions while parsing and normalizing the task. This can speed "
+        "up normalizing domains with large ADL conditions.")
+    argparser.add_argument(
+        "--parallel-parsing", action="store_true",
+        help="parse the domain file in a worker process while reading the "
+        "task file if the task file is larger than the domain file. Only "
+        "supported on platforms that can fork processes; ignored with "
+        "--domain-cache.")
+    argparser.add_argument(
+        "--domain-cache", metavar="DIR",
+        help="cache the parsed and normalized domain in DIR, keyed by the "
+        "content of the domain file, and reuse it for tasks of the same "
+        "domain. Only used for tasks whose goal is a conjunction of "
+        "literals.")
+    argparser.add_argument(
+        "--domain-cache-max-size", default=100, type=int, metavar="MB",
+        help="max total size of the domain cache in MiB. The least "
+        "recently used entries are removed first (default: %(default)d)")
     argparser.add_argument(
         "--dump-task", action="store_true",
         help="dump human-readable SAS+ representation of the task")
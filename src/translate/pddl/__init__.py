@@ -23,6 +23,9 @@ from .conditions import Conjunction
 from .conditions import Disjunction
 from .conditions import UniversalCondition
 from .conditions import ExistentialCondition
+from .conditions import hash_consing
+from .conditions import canonical_condition
+from .conditions import memoize_transformation
 
 from .effects import ConditionalEffect
 from .effects import ConjunctiveEffect
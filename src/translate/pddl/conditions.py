@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+from functools import wraps
 from typing import List
 
 from .pddl_types import TypedObject
@@ -9,6 +11,73 @@ from .pddl_types import TypedObject
 #
 # Careful: Most other classes (e.g. Effects, Axioms, Actions) are not!
 
+
+# Optional hash-consing. Within hash_consing(True), the transformations of
+# conditions return canonical objects, so that equal subconditions are shared,
+# and their results are memoized. Both tables are dropped when leaving the
+# context.
+_canonical_conditions = None
+_transformation_results = None
+
+
+@contextmanager
+def hash_consing(enabled=True):
+    global _canonical_conditions, _transformation_results
+    previous_tables = _canonical_conditions, _transformation_results
+    if enabled and _canonical_conditions is None:
+        _canonical_conditions = {}
+        _transformation_results = {}
+    try:
+        yield
+    finally:
+        _canonical_conditions, _transformation_results = previous_tables
+
+
+def canonical_condition(condition):
+    """Return the shared object for all conditions equal to the given one,
+    whose subconditions are shared as well. Without hash-consing, return the
+    condition itself."""
+    if _canonical_conditions is None:
+        return condition
+    result = _canonical_conditions.get(condition)
+    if result is None:
+        parts = [canonical_condition(part) for part in condition.parts]
+        if any(new is not old for new, old in zip(parts, condition.parts)):
+            condition = condition.change_parts(parts)
+        result = _canonical_conditions.setdefault(condition, condition)
+    return result
+
+
+def memoize_transformation(transformation):
+    """Memoize a function that maps conditions to equivalent conditions and
+    only depends on its argument, if hash-consing is enabled."""
+    if _canonical_conditions is None:
+        return transformation
+    results = {}
+
+    def memoized_transformation(condition):
+        result = results.get(condition)
+        if result is None:
+            result = canonical_condition(transformation(condition))
+            results[condition] = result
+        return result
+    return memoized_transformation
+
+
+def _memoized_method(method):
+    @wraps(method)
+    def memoized_method(self):
+        if _transformation_results is None:
+            return method(self)
+        key = (method.__name__, self)
+        result = _transformation_results.get(key)
+        if result is None:
+            result = canonical_condition(method(self))
+            _transformation_results[key] = result
+        return result
+    return memoized_method
+
+
 class Condition:
     def __init__(self, parts: List["Condition"]):
         self.parts = tuple(parts)
@@ -17,6 +86,11 @@ class Condition:
     def __hash__(self):
         return self.hash
 
+    def __reduce__(self):
+        # The precomputed hash is only valid in the current process (because
+        # of hash randomization), so unpickling recreates the condition.
+        return (self.__class__, (self.parts,))
+
     def __ne__(self, other):
         return not self == other
 
@@ -35,6 +109,16 @@ class Condition:
         return self.__class__.__name__
 
     def _postorder_visit(self, method_name, *args):
+        if _transformation_results is not None:
+            key = (method_name, self, args)
+            result = _transformation_results.get(key)
+            if result is None:
+                part_results = [part._postorder_visit(method_name, *args)
+                                for part in self.parts]
+                method = getattr(self, method_name, self._propagate)
+                result = canonical_condition(method(part_results, *args))
+                _transformation_results[key] = result
+            return result
         part_results = [part._postorder_visit(method_name, *args)
                         for part in self.parts]
         method = getattr(self, method_name, self._propagate)
@@ -56,10 +140,11 @@ class Condition:
         # Cannot used _postorder_visit because this requires preorder
         # for quantified effects.
         if not self.parts:
-            return self
+            return canonical_condition(self)
         else:
-            return self.__class__([part.uniquify_variables(type_map, renamings)
-                                   for part in self.parts])
+            return canonical_condition(self.__class__(
+                [part.uniquify_variables(type_map, renamings)
+                 for part in self.parts]))
 
     def to_untyped_strips(self):
         raise ValueError("Not a STRIPS condition: %s" % self.__class__.__name__)
@@ -99,6 +184,9 @@ class ConstantCondition(Condition):
     def __init__(self):
         self.hash = hash(self.__class__)
 
+    def __reduce__(self):
+        return (self.__class__, ())
+
     def change_parts(self, parts):
         return self
 
@@ -170,6 +258,7 @@ class Conjunction(JunctorCondition):
         for part in self.parts:
             part.instantiate(var_mapping, init_facts, fluent_facts, result)
 
+    @_memoized_method
     def negate(self):
         return Disjunction([p.negate() for p in self.parts])
 
@@ -190,6 +279,7 @@ class Disjunction(JunctorCondition):
             return result_parts[0]
         return Disjunction(result_parts)
 
+    @_memoized_method
     def negate(self):
         return Conjunction([p.negate() for p in self.parts])
 
@@ -208,6 +298,9 @@ class QuantifiedCondition(Condition):
         self.parts = tuple(parts)
         self.hash = hash((self.__class__, self.parameters, self.parts))
 
+    def __reduce__(self):
+        return (self.__class__, (self.parameters, self.parts))
+
     def __eq__(self, other):
         # Compare hash first for speed reasons.
         return (self.hash == other.hash and
@@ -230,7 +323,7 @@ class QuantifiedCondition(Condition):
         new_parameters = [par.uniquify_name(type_map, renamings)
                           for par in self.parameters]
         new_parts = (self.parts[0].uniquify_variables(type_map, renamings),)
-        return self.__class__(new_parameters, new_parts)
+        return canonical_condition(self.__class__(new_parameters, new_parts))
 
     def free_variables(self):
         result = Condition.free_variables(self)
@@ -248,6 +341,7 @@ class UniversalCondition(QuantifiedCondition):
         return UniversalCondition(self.parameters,
                                   [Disjunction(type_literals + parts)])
 
+    @_memoized_method
     def negate(self):
         return ExistentialCondition(self.parameters, [p.negate() for p in self.parts])
 
@@ -261,6 +355,7 @@ class ExistentialCondition(QuantifiedCondition):
         return ExistentialCondition(self.parameters,
                                     [Conjunction(type_literals + parts)])
 
+    @_memoized_method
     def negate(self):
         return UniversalCondition(self.parameters, [p.negate() for p in self.parts])
 
@@ -283,6 +378,9 @@ class Literal(Condition):
         self.args = tuple(args)
         self.hash = hash((self.__class__, self.predicate, self.args))
 
+    def __reduce__(self):
+        return (self.__class__, (self.predicate, self.args))
+
     def __eq__(self, other):
         # Compare hash first for speed reasons.
         return (self.hash == other.hash and
@@ -317,7 +415,7 @@ class Literal(Condition):
         return self
 
     def uniquify_variables(self, type_map, renamings={}):
-        return self.rename_variables(renamings)
+        return canonical_condition(self.rename_variables(renamings))
 
     def rename_variables(self, renamings):
         new_args = tuple(renamings.get(arg, arg) for arg in self.args)
@@ -346,6 +444,7 @@ class Atom(Literal):
         elif atom not in init_facts:
             raise Impossible()
 
+    @_memoized_method
     def negate(self):
         return NegatedAtom(self.predicate, self.args)
 
@@ -367,6 +466,7 @@ class NegatedAtom(Literal):
         elif atom in init_facts:
             raise Impossible()
 
+    @_memoized_method
     def negate(self):
         return Atom(self.predicate, self.args)
 
@@ -33,6 +33,9 @@ class PrimitiveNumericExpression(FunctionalExpression):
         self.symbol = symbol
         self.args = tuple(args)
         self.hash = hash((self.__class__, self.symbol, self.args))
+    def __reduce__(self):
+        # The precomputed hash is only valid in the current process.
+        return (self.__class__, (self.symbol, self.args))
     def __hash__(self):
         return self.hash
     def __eq__(self, other):
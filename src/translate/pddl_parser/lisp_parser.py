@@ -1,41 +1,121 @@
 __all__ = ["parse_nested_list"]
 
+from functools import partial
+import io
+from itertools import chain
+import re
+
+import tools
+
 from .parse_error import ParseError
 
 # Basic functions for parsing PDDL (Lisp) files.
-def parse_nested_list(input_file):
-    tokens = tokenize(input_file)
-    next_token = next(tokens)
+#
+# The input is a binary file in the Latin-1 encoding. We read and tokenize
+# it in large chunks that end at line breaks instead of line by line, and
+# build the nested lists with an explicit stack, so deeply nested
+# expressions do not hit the recursion limit.
+
+# Number of bytes we read from the input file at a time.
+CHUNK_SIZE = 1024 * 1024
+
+# Like a text file with universal newlines, we treat "\r" as a line break.
+COMMENT_RE = re.compile(rb";[^\r\n]*")
+
+
+def parse_nested_list(input_file, intern_tokens=None):
+    """intern_tokens is an optional function that maps a list of tokens to
+    a list of shared string objects for the same tokens."""
+    tokens = chain.from_iterable(
+        tokenize_in_chunks(input_file, intern_tokens))
+    next_token = next(tokens, None)
     if next_token != "(":
+        if next_token is None:
+            next_token = "end of file"
         raise ParseError(f"Expected '(', got '{next_token}'.")
-    result = list(parse_list_aux(tokens))
+    with tools.garbage_collection_disabled():
+        result = parse_list(tokens)
     remaining_tokens = list(tokens)
     if remaining_tokens:
         raise ParseError(f"Tokens remaining after parsing: "
                          f"{' '.join(remaining_tokens)}")
     return result
 
-def tokenize(input):
-    for line in input:
-        line = line.split(";", 1)[0]  # Strip comments.
-        try:
-            line.encode("ascii")
-        except UnicodeEncodeError:
-            raise ParseError(f"Non-ASCII character outside comment: {line[0:-1]}")
-        line = line.replace("(", " ( ").replace(")", " ) ").replace("?", " ?")
-        for token in line.split():
-            yield token.lower()
-
-def parse_list_aux(tokenstream):
-    # Leading "(" has already been swallowed.
-    while True:
-        try:
-            token = next(tokenstream)
-        except StopIteration:
-            raise ParseError("Missing ')'")
-        if token == ")":
-            return
-        elif token == "(":
-            yield list(parse_list_aux(tokenstream))
+
+def read_chunks(input_file):
+    """Generate the content of the file in chunks of roughly CHUNK_SIZE
+    bytes that end at line breaks (except for the last one)."""
+    pending = []
+    for data in iter(partial(input_file.read, CHUNK_SIZE), b""):
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            pending.append(data)
+            continue
+        pending.append(data[:end])
+        yield b"".join(pending)
+        pending = [data[end:]]
+    chunk = b"".join(pending)
+    if chunk:
+        yield chunk
+
+
+def tokenize_in_chunks(input_file, intern_tokens=None):
+    """Generate the lists of lower-case tokens of the chunks of the
+    file."""
+    seen_tokens = False
+    for chunk in read_chunks(input_file):
+        code = chunk
+        if b";" in code:
+            code = COMMENT_RE.sub(b"", code)
+        if not code.isascii():
+            raise_non_ascii_error(chunk, check_first_token=not seen_tokens)
+        tokens = split_into_tokens(code.lower().decode("ascii"))
+        if intern_tokens is not None:
+            tokens = intern_tokens(tokens)
+        seen_tokens = seen_tokens or bool(tokens)
+        yield tokens
+
+
+def split_into_tokens(code):
+    # Tokens are parentheses, variables (starting with "?") and names,
+    # separated by whitespace. On the whole chunk, this is considerably
+    # faster than a regular expression.
+    code = code.replace("(", " ( ").replace(")", " ) ").replace("?", " ?")
+    return code.split()
+
+
+def raise_non_ascii_error(chunk, check_first_token):
+    # Report the first line with a non-ASCII character outside comments,
+    # unless the file does not start with "(" before that line.
+    text = chunk.decode("ISO-8859-1")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    previous_lines = []
+    for line in io.StringIO(text):
+        line = line.split(";", 1)[0]
+        if not line.isascii():
+            tokens = split_into_tokens(" ".join(previous_lines).lower())
+            if check_first_token and tokens and tokens[0] != "(":
+                raise ParseError(f"Expected '(', got '{tokens[0]}'.")
+            raise ParseError(
+                f"Non-ASCII character outside comment: {line[0:-1]}")
+        previous_lines.append(line)
+
+
+def parse_list(tokens):
+    # Leading "(" has already been swallowed. Consumes the tokens up to
+    # and including the matching ")".
+    stack = []
+    current = []
+    for token in tokens:
+        if token == "(":
+            sublist = []
+            current.append(sublist)
+            stack.append(current)
+            current = sublist
+        elif token == ")":
+            if not stack:
+                return current
+            current = stack.pop()
         else:
-            yield token
+            current.append(token)
+    raise ParseError("Missing ')'")
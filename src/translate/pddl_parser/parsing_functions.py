@@ -1,8 +1,10 @@
 import contextlib
+from itertools import chain
 import sys
 
 import graph
 import pddl
+import tools
 from .warning import print_warning
 from .parse_error import ParseError
 
@@ -47,6 +49,25 @@ CONDITION_TAG_TO_SYNTAX = {
 }
 
 
+class SymbolTable:
+    """Maps each name to one shared string object.
+
+    The parser passes all tokens of the domain and task files through the
+    same symbol table, so all occurrences of an object, predicate or
+    variable name in the parsed task (and in everything the translator
+    derives from it) are the same object. This saves a lot of memory for
+    tasks with many facts, and comparing or hashing identical strings is
+    cheap."""
+    def __init__(self):
+        self.symbols = {}
+
+    def intern(self, name):
+        return self.symbols.setdefault(name, name)
+
+    def intern_all(self, names):
+        return list(map(self.symbols.setdefault, names, names))
+
+
 class Context:
     def __init__(self):
         self._traceback = []
@@ -561,11 +582,59 @@ def parse_axioms_and_actions(context, entries, type_dict, predicate_dict, consta
     return the_axioms, the_actions
 
 
+def is_init_assignment(fact):
+    return isinstance(fact, list) and bool(fact) and fact[0] == "="
+
+
+def parse_plain_init_atoms(facts, predicate_dict, term_names):
+    """Return the atoms for the given init facts if they are distinct,
+    valid, positive ground atoms. Otherwise, return None, and parse_init
+    processes them one by one to report errors and warnings.
+
+    This checks all facts at once, which is much faster for large init
+    blocks."""
+    if not all(type(fact) is list and fact for fact in facts):
+        return None
+    keys = list(map(tuple, facts))
+    try:
+        if len(set(keys)) != len(keys):
+            return None
+    except TypeError:
+        # Some fact has a nested list as argument.
+        return None
+    arities = {name: len(predicate.arguments)
+               for name, predicate in predicate_dict.items()
+               if name not in ("=", "not")}
+    signatures = {(key[0], len(key) - 1) for key in keys}
+    if any(arities.get(name) != arity for name, arity in signatures):
+        return None
+    if not term_names.issuperset(
+            chain.from_iterable(key[1:] for key in keys)):
+        return None
+    return [pddl.Atom(key[0], key[1:]) for key in keys]
+
+
 def parse_init(context, alist, predicate_dict, term_names):
     initial = []
     initial_proposition_values = dict()
     initial_assignments = dict()
-    for no, fact in enumerate(alist[1:], start=1):
+    facts = alist[1:]
+    with tools.garbage_collection_disabled():
+        assignments = []
+        other_facts = []
+        for no, fact in enumerate(facts, start=1):
+            if is_init_assignment(fact):
+                assignments.append((no, fact))
+            else:
+                other_facts.append(fact)
+        plain_atoms = parse_plain_init_atoms(
+            other_facts, predicate_dict, term_names)
+    if plain_atoms is not None:
+        # Only the assignments remain to be parsed.
+        elements = assignments
+    else:
+        elements = enumerate(facts, start=1)
+    for no, fact in elements:
         with context.layer(f"Parsing element #{no} in init block"):
             if not isinstance(fact, list) or not fact:
                 context.error(
@@ -613,17 +682,34 @@ def parse_init(context, alist, predicate_dict, term_names):
                 check_atom_consistency(context, atom,
                                        initial_proposition_values, atom_value)
                 initial_proposition_values[atom] = atom_value
-    initial.extend(atom for atom, val in initial_proposition_values.items()
-                   if val is True)
+    if plain_atoms is not None:
+        initial.extend(plain_atoms)
+    else:
+        initial.extend(atom for atom, val in initial_proposition_values.items()
+                       if val is True)
     return initial
 
 
 def parse_task(domain_pddl, task_pddl):
     context = Context()
+    domain = parse_domain(context, domain_pddl)
+    return parse_task_for_domain(context, domain, task_pddl)
+
+
+def parse_domain(context, domain_pddl):
+    """Return the tuple (domain_name, requirements, types, type_dict,
+    constants, predicates, predicate_dict, functions, actions, axioms)."""
     if not isinstance(domain_pddl, list):
         context.error("Invalid definition of a PDDL domain.")
+    return tuple(parse_domain_pddl(context, domain_pddl))
+
+
+def parse_task_for_domain(context, domain, task_pddl, check_domain=True):
+    """Parse the task for a domain returned by parse_domain. Without
+    check_domain, we skip the checks that only concern the domain, e.g.
+    because it has already been checked and normalized."""
     domain_name, domain_requirements, types, type_dict, constants, predicates, \
-        predicate_dict, functions, actions, axioms = parse_domain_pddl(context, domain_pddl)
+        predicate_dict, functions, actions, axioms = domain
     if not isinstance(task_pddl, list):
         context.error("Invalid definition of a PDDL task.")
     task_name, task_domain_name, task_requirements, objects, init, goal, \
@@ -640,7 +726,8 @@ def parse_task(domain_pddl, task_pddl):
     objects = constants + objects
 
     check_for_duplicates(context, [o.name for o in objects], "object")
-    check_for_duplicates(context, [a.name for a in actions], "action")
+    if check_domain:
+        check_for_duplicates(context, [a.name for a in actions], "action")
 
     init += [pddl.Atom("=", (obj.name, obj.name)) for obj in objects]
 
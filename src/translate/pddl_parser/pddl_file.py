@@ -1,28 +1,186 @@
+import contextlib
+import gzip
+import lzma
+import io
+import multiprocessing
+import os
+import pickle
+import sys
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 from . import lisp_parser
 from . import parse_error
 from . import parsing_functions
 
 file_open = open
 
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Errors for unreadable files, including truncated or corrupt compressed
+# files.
+READ_ERRORS = (OSError, EOFError, lzma.LZMAError)
+if zstandard is not None:
+    READ_ERRORS += (zstandard.ZstdError,)
+
 
-def parse_pddl_file(type, filename):
+@contextlib.contextmanager
+def open_pddl_file(filename):
+    """Open the file for reading in binary mode. Files compressed with
+    gzip, xz or zstd are decompressed on the fly. The file is only opened
+    once, so this also works for pipes."""
+    with file_open(filename, "rb") as input_file:
+        header = input_file.peek(8)[:8]
+        if header.startswith(GZIP_MAGIC):
+            decompressed_file = gzip.GzipFile(fileobj=input_file, mode="rb")
+        elif header.startswith(XZ_MAGIC):
+            decompressed_file = lzma.LZMAFile(input_file, "rb")
+        elif header.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise SystemExit("Error: Could not read file: %s\nReason: "
+                                 "reading zstd-compressed files requires the "
+                                 "zstandard module" % filename)
+            decompressed_file = zstandard.ZstdDecompressor().stream_reader(
+                input_file, read_across_frames=True, closefd=False)
+        else:
+            yield input_file
+            return
+        with decompressed_file:
+            yield decompressed_file
+
+
+def parse_pddl_file(type, filename, symbols=None):
     try:
         # The builtin open function is shadowed by this module's open function.
-        # We use the Latin-1 encoding (which allows a superset of ASCII, of the
-        # Latin-* encodings and of UTF-8) to allow special characters in
-        # comments. In all other parts, we later validate that only ASCII is
-        # used.
-        return lisp_parser.parse_nested_list(file_open(filename,
-                                                       encoding='ISO-8859-1'))
-    except OSError as e:
+        # The parser reads the file as Latin-1 (which allows a superset of
+        # ASCII, of the Latin-* encodings and of UTF-8) to allow special
+        # characters in comments. In all other parts, it validates that only
+        # ASCII is used.
+        with open_pddl_file(filename) as input_file:
+            return lisp_parser.parse_nested_list(
+                input_file, None if symbols is None else symbols.intern_all)
+    except READ_ERRORS as e:
         raise SystemExit("Error: Could not read file: %s\nReason: %s" %
-                         (e.filename, e))
+                         (getattr(e, "filename", None) or filename, e))
     except parse_error.ParseError as e:
         raise parse_error.ParseError("Error: Could not parse %s file: %s\nReason: %s" %
                          (type, filename, e))
 
 
-def open(domain_filename=None, task_filename=None):
+def should_parse_in_parallel(domain_filename, task_filename):
+    # Passing the parsed domain to the main process only pays off if
+    # reading the task file takes longer than parsing the domain.
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return False
+    try:
+        return os.path.getsize(task_filename) > os.path.getsize(domain_filename)
+    except OSError:
+        return False
+
+
+class SymbolPickler(pickle.Pickler):
+    """Pickle strings by reference, so that SymbolUnpickler can intern
+    them."""
+    def persistent_id(self, obj):
+        if type(obj) is str:
+            return obj
+        return None
+
+
+class SymbolUnpickler(pickle.Unpickler):
+    """Unpickle the output of SymbolPickler, interning all strings through
+    the given symbol table."""
+    def __init__(self, file, symbols):
+        super().__init__(file)
+        self.symbols = symbols
+
+    def persistent_load(self, pid):
+        return self.symbols.intern(pid)
+
+
+def send_with_symbols(connection, obj):
+    data = io.BytesIO()
+    SymbolPickler(data, pickle.HIGHEST_PROTOCOL).dump(obj)
+    connection.send_bytes(data.getbuffer())
+
+
+def receive_with_symbols(connection, symbols):
+    return SymbolUnpickler(
+        io.BytesIO(connection.recv_bytes()), symbols).load()
+
+
+def parse_domain_in_worker(domain_filename, connection):
+    # Send the outcome tagged with the stage in which parsing stopped, so
+    # that the main process can report errors in the same order as when
+    # parsing sequentially.
+    try:
+        try:
+            domain_pddl = parse_pddl_file("domain", domain_filename)
+        except (parse_error.ParseError, SystemExit) as e:
+            send_with_symbols(connection, ("file", e))
+            return
+        try:
+            domain = parsing_functions.parse_domain(
+                parsing_functions.Context(), domain_pddl)
+        except (parse_error.ParseError, SystemExit) as e:
+            send_with_symbols(connection, ("domain", e))
+            return
+        send_with_symbols(connection, ("ok", domain))
+    finally:
+        connection.close()
+
+
+def parse_in_parallel(domain_filename, task_filename, symbols):
+    """Parse the domain in a worker process while the main process reads
+    and tokenizes the task file. Only the parsed domain, which is usually
+    small compared to the task, is passed between the processes."""
+    context = multiprocessing.get_context("fork")
+    connection, worker_connection = context.Pipe(duplex=False)
+    # Otherwise, the worker would print buffered output a second time.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    worker = context.Process(
+        target=parse_domain_in_worker,
+        args=(domain_filename, worker_connection), daemon=True)
+    worker.start()
+    worker_connection.close()
+    try:
+        task_error = None
+        try:
+            task_pddl = parse_pddl_file("task", task_filename, symbols)
+        except (parse_error.ParseError, SystemExit) as e:
+            task_error = e
+        try:
+            # Intern the names of the domain like those of the task.
+            stage, domain_result = receive_with_symbols(connection, symbols)
+        except EOFError:
+            # The worker failed unexpectedly. Parse the domain here to
+            # report the problem.
+            stage = "ok"
+            domain_result = parsing_functions.parse_domain(
+                parsing_functions.Context(),
+                parse_pddl_file("domain", domain_filename, symbols))
+    finally:
+        connection.close()
+        worker.join()
+
+    if stage == "file":
+        raise domain_result
+    elif task_error is not None:
+        raise task_error
+    elif stage == "domain":
+        raise domain_result
+    return parsing_functions.parse_task_for_domain(
+        parsing_functions.Context(), domain_result, task_pddl)
+
+
+def open(domain_filename=None, task_filename=None, parallel=False):
+    """With parallel, parse the domain file in a worker process if the
+    platform supports it and the task file is larger."""
     if domain_filename is None or task_filename is None:
         # Importing options triggers parsing the problem and domain file names
         # as arguments from the command line. We don't import unconditionally
@@ -33,7 +191,10 @@ def open(domain_filename=None, task_filename=None):
         domain_filename = domain_filename or options.domain
         task_filename = task_filename or options.task
 
-    domain_pddl = parse_pddl_file("domain", domain_filename)
-    task_pddl = parse_pddl_file("task", task_filename)
+    symbols = parsing_functions.SymbolTable()
+    if parallel and should_parse_in_parallel(domain_filename, task_filename):
+        return parse_in_parallel(domain_filename, task_filename, symbols)
+    domain_pddl = parse_pddl_file("domain", domain_filename, symbols)
+    task_pddl = parse_pddl_file("task", task_filename, symbols)
 
     return parsing_functions.parse_task(domain_pddl, task_pddl)
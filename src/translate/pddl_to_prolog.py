@@ -35,15 +35,24 @@ class PrologProgram:
         self.remove_free_effect_variables()
         self.split_duplicate_arguments()
         self.convert_trivial_rules()
-    def split_rules(self):
+    def split_rules(self, cardinality_join_order=False):
+        import greedy_join
         import split_rules
         # Splits rules whose conditions can be partitioned in such a way that
         # the parts have disjoint variable sets, then split n-ary joins into
         # a number of binary joins, introducing new pseudo-predicates for the
-        # intermediate values.
+        # intermediate values. With cardinality_join_order=True, the order
+        # of the binary joins is based on the estimated relation sizes.
+        if cardinality_join_order:
+            statistics = greedy_join.RelationStatistics(self)
+        else:
+            statistics = None
         new_rules = []
         for rule in self.rules:
-            new_rules += split_rules.split_rule(rule, self.new_name)
+            for new_rule in split_rules.split_rule(rule, self.new_name,
+                                                   statistics):
+                new_rule.origin = rule.origin
+                new_rules.append(new_rule)
         self.rules = new_rules
     def remove_free_effect_variables(self):
         """Remove free effect variables like the variable Y in the rule
@@ -109,9 +118,12 @@ class Fact:
         return "%s." % self.atom
 
 class Rule:
-    def __init__(self, conditions, effect):
+    def __init__(self, conditions, effect, origin=None):
         self.conditions = conditions
         self.effect = effect
+        # A (kind, name) pair describing the action, axiom or goal the rule
+        # was created from (see get_rule_origin).
+        self.origin = origin
     def add_condition(self, condition):
         self.conditions.append(condition)
     def get_variables(self):
@@ -142,6 +154,25 @@ class Rule:
         cond_str = ", ".join(map(str, self.conditions))
         return "%s :- %s." % (self.effect, cond_str)
 
+def get_rule_origin(conditions, effect):
+    """Return a (kind, name) pair describing what the exploration rule
+    with the given conditions and effect was created from by
+    normalize.build_exploration_rules. The kind is "action" (applicability
+    of an action), "effect" (effect of an action), "axiom" or "goal"."""
+    predicate = effect.predicate
+    if isinstance(predicate, pddl.Action):
+        return ("action", predicate.name)
+    elif isinstance(predicate, pddl.Axiom):
+        return ("axiom", predicate.name)
+    elif predicate == "@goal-reachable":
+        return ("goal", None)
+    first_predicate = conditions[0].predicate
+    if isinstance(first_predicate, pddl.Action):
+        return ("effect", first_predicate.name)
+    else:
+        assert isinstance(first_predicate, pddl.Axiom)
+        return ("axiom", first_predicate.name)
+
 def translate_typed_object(prog, obj, type_dict):
     supertypes = type_dict[obj.type_name].supertype_names
     for type_name in [obj.type_name] + supertypes:
@@ -160,18 +191,24 @@ def translate_facts(prog, task):
             # fact.fluent has been defined.
             prog.add_fact(normalize.get_pne_definition_predicate(fact.fluent))
 
-def translate(task):
+def translate(task, relevance_analysis=False, cardinality_join_order=False):
     # Note: The function requires that the task has been normalized.
+    # With relevance_analysis=True, the program only derives atoms that
+    # are relevant for reaching the goal (see magic_sets.py).
     with timers.timing("Generating Datalog program"):
         prog = PrologProgram()
         translate_facts(prog, task)
         for conditions, effect in normalize.build_exploration_rules(task):
-            prog.add_rule(Rule(conditions, effect))
+            origin = get_rule_origin(conditions, effect)
+            prog.add_rule(Rule(conditions, effect, origin))
     with timers.timing("Normalizing Datalog program", block=True):
         # Using block=True because normalization can output some messages
         # in rare cases.
         prog.normalize()
-        prog.split_rules()
+        if relevance_analysis:
+            import magic_sets
+            magic_sets.rewrite(prog, task)
+        prog.split_rules(cardinality_join_order)
     return prog
 
 
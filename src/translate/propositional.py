@@ -0,0 +1,362 @@
+# propositional: Lightweight pipeline for propositional (grounded) tasks.
+#
+# For tasks whose actions, axioms and conditions have no parameters, the
+# Datalog exploration and the lifted invariant synthesis are pure overhead
+# (and the invariant synthesis considers one candidate per fact, which is
+# why it is capped by --invariant-generation-max-candidates). For these
+# tasks, we compute the relaxed reachable facts by forward chaining over
+# integer facts, instantiate the reachable actions and axioms directly, and
+# find mutex groups by checking candidate fact sets against the ground
+# actions. Like invariant_finder, we start with one candidate per fact and
+# refine candidates that are not balanced by an action with its delete
+# effects.
+#
+# explore and compute_groups return the same as instantiate.explore and
+# fact_groups.compute_groups.
+
+from collections import defaultdict, deque
+import itertools
+import time
+
+import fact_groups
+import grounding_budget
+import instantiate
+import options
+import pddl
+import timers
+
+
+def get_parts(condition):
+    if isinstance(condition, pddl.Conjunction):
+        return condition.parts
+    return (condition,)
+
+
+def is_ground_condition(condition):
+    return all(isinstance(part, (pddl.Truth, pddl.Falsity)) or
+               (isinstance(part, pddl.Literal) and not part.args)
+               for part in get_parts(condition))
+
+
+def is_propositional(task):
+    """Test if the normalized task only has parameter-free actions, axioms
+    and conditions over nullary predicates."""
+    for action in task.actions:
+        if action.parameters or not is_ground_condition(action.precondition):
+            return False
+        for effect in action.effects:
+            if (effect.parameters or effect.literal.args or
+                    not is_ground_condition(effect.condition)):
+                return False
+        if (action.cost is not None and
+                isinstance(action.cost.expression,
+                           pddl.PrimitiveNumericExpression) and
+                action.cost.expression.args):
+            return False
+    for axiom in task.axioms:
+        if axiom.parameters or not is_ground_condition(axiom.condition):
+            return False
+    return is_ground_condition(task.goal)
+
+
+class ReachabilityRules:
+    """Rules over integer nodes for the facts, actions, axioms and the goal,
+    whose bodies are the positive atoms of the conditions."""
+    def __init__(self):
+        self.num_nodes = 0
+        self.fact_nodes = {}
+        self.heads = []
+        self.num_missing = []
+        self.rules_by_body_node = defaultdict(list)
+        self.initial_nodes = []
+
+    def new_node(self):
+        self.num_nodes += 1
+        return self.num_nodes - 1
+
+    def get_fact_node(self, atom):
+        node = self.fact_nodes.get(atom)
+        if node is None:
+            node = self.fact_nodes[atom] = self.new_node()
+        return node
+
+    def add_rule(self, condition, head, extra_body_node=None):
+        body = set()
+        if extra_body_node is not None:
+            body.add(extra_body_node)
+        for part in get_parts(condition):
+            if isinstance(part, pddl.Falsity):
+                return
+            elif isinstance(part, pddl.Literal) and not part.negated:
+                body.add(self.get_fact_node(part))
+        rule_id = len(self.heads)
+        self.heads.append(head)
+        self.num_missing.append(len(body))
+        for node in body:
+            self.rules_by_body_node[node].append(rule_id)
+        if not body:
+            self.initial_nodes.append(head)
+
+    def compute_reached_nodes(self, initial_facts):
+        queue = list(self.initial_nodes)
+        queue += [self.fact_nodes[fact] for fact in initial_facts
+                  if fact in self.fact_nodes]
+        reached = bytearray(self.num_nodes)
+        num_missing = self.num_missing
+        heads = self.heads
+        rules_by_body_node = self.rules_by_body_node
+        while queue:
+            node = queue.pop()
+            if reached[node]:
+                continue
+            reached[node] = True
+            for rule_id in rules_by_body_node.get(node, ()):
+                num_missing[rule_id] -= 1
+                if not num_missing[rule_id]:
+                    queue.append(heads[rule_id])
+        return reached
+
+
+def compute_reachability(task, init_facts, init_assignments):
+    """Return the relaxed reachable facts, actions and axioms of the task
+    and whether the goal is relaxed reachable."""
+    rules = ReachabilityRules()
+    action_nodes = []
+    for action in task.actions:
+        # Like the Datalog exploration, we require that the primitive
+        # numeric expression of the action cost is defined.
+        if (isinstance(action.cost, pddl.Increase) and
+                isinstance(action.cost.expression,
+                           pddl.PrimitiveNumericExpression) and
+                action.cost.expression not in init_assignments):
+            continue
+        action_node = rules.new_node()
+        action_nodes.append((action, action_node))
+        rules.add_rule(action.precondition, action_node)
+        for effect in action.effects:
+            if not effect.literal.negated:
+                rules.add_rule(effect.condition,
+                               rules.get_fact_node(effect.literal),
+                               action_node)
+    axiom_nodes = []
+    for axiom in task.axioms:
+        axiom_node = rules.new_node()
+        axiom_nodes.append((axiom, axiom_node))
+        rules.add_rule(axiom.condition, axiom_node)
+        rules.add_rule(pddl.Truth(),
+                       rules.get_fact_node(pddl.Atom(axiom.name, [])),
+                       axiom_node)
+    goal_node = rules.new_node()
+    rules.add_rule(task.goal, goal_node)
+
+    reached = rules.compute_reached_nodes(init_facts)
+    reached_facts = set(init_facts)
+    reached_facts.update(fact for fact, node in rules.fact_nodes.items()
+                         if reached[node])
+    reached_actions = [action for action, node in action_nodes
+                       if reached[node]]
+    reached_axioms = [axiom for axiom, node in axiom_nodes if reached[node]]
+    return (reached_facts, reached_actions, reached_axioms,
+            bool(reached[goal_node]))
+
+
+def explore(task):
+    """Like instantiate.explore for a normalized propositional task."""
+    init_facts = set()
+    init_assignments = {}
+    for element in task.init:
+        if isinstance(element, pddl.Assign):
+            init_assignments[element.fluent] = element.expression
+        else:
+            init_facts.add(element)
+
+    with timers.timing("Computing relaxed reachable facts"):
+        (reached_facts, reached_actions, reached_axioms,
+         relaxed_reachable) = compute_reachability(
+             task, init_facts, init_assignments)
+    budget = grounding_budget.get_budget(task)
+    if budget is not None:
+        # Check the budget like for the model of the Datalog exploration,
+        # which contains an atom for each reachable action and axiom.
+        model = list(reached_facts)
+        model += [pddl.Atom(action, ()) for action in reached_actions]
+        model += [pddl.Atom(axiom, ()) for axiom in reached_axioms]
+        budget.check_model(model)
+    fluent_predicates = instantiate.get_fluent_predicates(task)
+    fluent_facts = {fact for fact in reached_facts
+                    if fact.predicate in fluent_predicates}
+    print("%d relaxed reachable facts" % len(fluent_facts))
+
+    with timers.timing("Instantiating actions and axioms"):
+        objects_by_type = instantiate.get_objects_by_type(
+            task.objects, task.types)
+        instantiated_actions = []
+        reachable_action_parameters = defaultdict(list)
+        for action in reached_actions:
+            reachable_action_parameters[action].append(())
+            inst_action = action.instantiate(
+                {}, init_facts, init_assignments, fluent_facts,
+                objects_by_type, task.use_min_cost_metric)
+            if inst_action:
+                instantiated_actions.append(inst_action)
+        instantiated_axioms = []
+        for axiom in reached_axioms:
+            inst_axiom = axiom.instantiate({}, init_facts, fluent_facts)
+            if inst_axiom:
+                instantiated_axioms.append(inst_axiom)
+        instantiated_goal = instantiate.instantiate_goal(
+            task.goal, init_facts, fluent_facts)
+        if budget is not None:
+            budget.check_memory("instantiation")
+
+    return (relaxed_reachable, fluent_facts, instantiated_actions,
+            instantiated_goal, sorted(instantiated_axioms),
+            reachable_action_parameters)
+
+
+def is_consistent(literals):
+    literals = set(literals)
+    return not any(literal.negate() in literals for literal in literals)
+
+
+class MutexChecker:
+    """Checks candidates, which are sets of fact ids. The ids are the
+    positions of the facts in the given sorted list."""
+    def __init__(self, facts, actions):
+        self.fact_ids = {fact: fact_id for fact_id, fact in enumerate(facts)}
+        self.actions_by_added_fact = defaultdict(list)
+        # The add and delete effects on candidate facts with the fact ids.
+        self.add_effects = {}
+        self.del_effects = {}
+        # The facts that each action requires and deletes unconditionally.
+        # Deleting one of them balances all add effects on the candidate.
+        self.consumed_facts = {}
+        for action in actions:
+            add_effects = self._get_candidate_effects(action.add_effects)
+            if not add_effects:
+                continue
+            self.add_effects[action] = add_effects
+            del_effects = self._get_candidate_effects(action.del_effects)
+            self.del_effects[action] = del_effects
+            precondition = set(action.precondition)
+            self.consumed_facts[action] = {
+                fact_id for condition, fact, fact_id in del_effects
+                if not condition and fact in precondition}
+            for _, _, fact_id in add_effects:
+                add_actions = self.actions_by_added_fact[fact_id]
+                if not add_actions or add_actions[-1] is not action:
+                    add_actions.append(action)
+
+    def _get_candidate_effects(self, effects):
+        result = []
+        for condition, fact in effects:
+            fact_id = self.fact_ids.get(fact)
+            if fact_id is not None:
+                result.append((condition, fact, fact_id))
+        return result
+
+    def check(self, candidate, enqueue_func):
+        """Test if at most one fact of the candidate can be true in a
+        state reached by an action, given that at most one fact is true
+        before. Enqueue refined candidates if an add effect is not
+        balanced by a delete effect."""
+        checked_actions = set()
+        for fact_id in sorted(candidate):
+            for action in self.actions_by_added_fact.get(fact_id, ()):
+                if action in checked_actions:
+                    continue
+                checked_actions.add(action)
+                if (self._too_heavy(candidate, action) or
+                        self._unbalanced(candidate, action, enqueue_func)):
+                    return False
+        return True
+
+    def _too_heavy(self, candidate, action):
+        if len(self.add_effects[action]) < 2:
+            return False
+        add_effects = [(condition, fact)
+                       for condition, fact, fact_id in self.add_effects[action]
+                       if fact_id in candidate]
+        for (cond1, fact1), (cond2, fact2) in itertools.combinations(
+                add_effects, 2):
+            if fact1 != fact2 and is_consistent(itertools.chain(
+                    action.precondition, cond1, cond2,
+                    [fact1.negate(), fact2.negate()])):
+                return True
+        return False
+
+    def _unbalanced(self, candidate, action, enqueue_func):
+        if not candidate.isdisjoint(self.consumed_facts[action]):
+            return False
+        del_effects = [(condition, fact)
+                       for condition, fact, fact_id in self.del_effects[action]
+                       if fact_id in candidate]
+        for condition, fact, fact_id in self.add_effects[action]:
+            if fact_id not in candidate:
+                continue
+            # What must be true for the add effect to make the fact true.
+            produced_by = set(itertools.chain(
+                action.precondition, condition, [fact.negate()]))
+            if not is_consistent(produced_by):
+                continue
+            # The add effect is balanced by a delete effect of a fact that
+            # is true whenever the add effect makes the fact true.
+            if not any(deleted in produced_by and
+                       produced_by.issuperset(del_condition)
+                       for del_condition, deleted in del_effects):
+                self._refine_candidate(candidate, action, enqueue_func)
+                return True
+        return False
+
+    def _refine_candidate(self, candidate, action, enqueue_func):
+        for _, _, fact_id in self.del_effects[action]:
+            if fact_id not in candidate:
+                enqueue_func(candidate | {fact_id})
+
+
+def find_mutex_groups(task, atoms, actions):
+    derived_predicates = {axiom.name for axiom in task.axioms}
+    facts = sorted(fact for fact in atoms
+                   if fact.predicate not in derived_predicates)
+    limit = options.invariant_generation_max_candidates
+    candidates = deque(itertools.islice(
+        (frozenset([fact_id]) for fact_id in range(len(facts))), limit))
+    print(len(candidates), "initial candidates")
+    seen_candidates = set(candidates)
+
+    def enqueue_func(candidate):
+        if len(seen_candidates) < limit and candidate not in seen_candidates:
+            candidates.append(candidate)
+            seen_candidates.add(candidate)
+
+    checker = MutexChecker(facts, actions)
+    initial_fact_ids = {checker.fact_ids[fact] for fact in task.init
+                        if fact in checker.fact_ids}
+    groups = []
+    start_time = time.process_time()
+    while candidates:
+        candidate = candidates.popleft()
+        if time.process_time() - start_time > options.invariant_generation_max_time:
+            print("Time limit reached, aborting mutex group generation")
+            break
+        # Like invariant_finder.useful_groups, we only keep groups with
+        # exactly one initially true fact. Refining a candidate with more
+        # than one cannot lead to such a group.
+        num_initial_facts = len(candidate & initial_fact_ids)
+        if (num_initial_facts <= 1 and
+                checker.check(candidate, enqueue_func) and
+                num_initial_facts == 1):
+            groups.append([facts[fact_id] for fact_id in sorted(candidate)])
+    print("%d mutex groups" % len(groups))
+    return groups
+
+
+def compute_groups(task, atoms, actions, negative_in_goal):
+    """Like fact_groups.compute_groups for a propositional task with the
+    given instantiated actions."""
+    if options.invariant_generation_max_candidates > 0:
+        with timers.timing("Finding mutex groups", block=True):
+            groups = find_mutex_groups(task, atoms, actions)
+    else:
+        groups = []
+    return fact_groups.select_groups(groups, atoms, negative_in_goal)
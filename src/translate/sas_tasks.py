@@ -1,11 +1,110 @@
+import heapq
+from itertools import islice
+import pickle
+import tempfile
 from typing import List, Tuple
 
+import tools
+
 SAS_FILE_VERSION = 3
 
 DEBUG = False
 
 VarValPair = Tuple[int, int]
 
+# Number of operators that OperatorStore writes to its file at a time.
+STORE_CHUNK_SIZE = 1000
+# Number of operators that OperatorStore.sorted sorts in memory at a time.
+SORT_RUN_SIZE = 100000
+
+
+def get_operator_sort_key(op):
+    return (op.name, op.prevail, op.pre_post)
+
+
+class OperatorStore:
+    """Sequence of SASOperators that is kept in a temporary file instead of
+    in memory.
+
+    Supports the operations that the translator uses on operator lists:
+    appending, iterating, len and replacing the whole content with
+    store[:] = operators. The store must not be modified while iterating
+    over it."""
+
+    def __init__(self, operators=()):
+        self.file = tempfile.TemporaryFile()
+        self.num_stored = 0
+        self.pending = []
+        self.extend(operators)
+
+    def append(self, op):
+        self.pending.append(op)
+        if len(self.pending) >= STORE_CHUNK_SIZE:
+            self._write_pending()
+
+    def extend(self, operators):
+        for op in operators:
+            self.append(op)
+
+    def _write_pending(self):
+        self.file.seek(0, 2)
+        with tools.garbage_collection_disabled():
+            pickle.dump(self.pending, self.file, pickle.HIGHEST_PROTOCOL)
+        self.num_stored += len(self.pending)
+        self.pending = []
+
+    def __len__(self):
+        return self.num_stored + len(self.pending)
+
+    def __iter__(self):
+        if self.pending:
+            self._write_pending()
+        self.file.flush()
+        self.file.seek(0)
+        num_read = 0
+        while num_read < self.num_stored:
+            chunk = self._load_chunk()
+            num_read += len(chunk)
+            yield from chunk
+
+    def _load_chunk(self):
+        with tools.garbage_collection_disabled():
+            return pickle.load(self.file)
+
+    def __setitem__(self, index, operators):
+        assert index == slice(None), "only store[:] = ... is supported"
+        new_store = OperatorStore(operators)
+        self.close()
+        self.file = new_store.file
+        self.num_stored = new_store.num_stored
+        self.pending = new_store.pending
+
+    def close(self):
+        self.file.close()
+
+    def sorted(self, key):
+        """Return a new store with the operators sorted stably by key.
+
+        Sorts runs of SORT_RUN_SIZE operators in memory and merges them."""
+        with tools.garbage_collection_disabled():
+            return self._sorted(key)
+
+    def _sorted(self, key):
+        runs = []
+        operators = iter(self)
+        while True:
+            run = sorted(islice(operators, SORT_RUN_SIZE), key=key)
+            if not run:
+                break
+            runs.append(OperatorStore(run))
+        if len(runs) == 1:
+            return runs[0]
+        result = OperatorStore(heapq.merge(*runs, key=key))
+        for run in runs:
+            run.close()
+        return result
+
+
 class SASTask:
     """Planning task in finite-domain representation.
 
@@ -26,8 +125,13 @@ class SASTask:
         self.mutexes = mutexes
         self.init = init
         self.goal = goal
-        self.operators = sorted(operators, key=lambda op: (
-            op.name, op.prevail, op.pre_post))
+        if isinstance(operators, OperatorStore):
+            # The task takes ownership of the store and only keeps the
+            # sorted copy, so we remove the file of the original.
+            self.operators = operators.sorted(key=get_operator_sort_key)
+            operators.close()
+        else:
+            self.operators = sorted(operators, key=get_operator_sort_key)
         self.axioms = sorted(axioms, key=lambda axiom: (
             axiom.condition, axiom.effect))
         self.metric = metric
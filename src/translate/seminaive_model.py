@@ -0,0 +1,415 @@
+#! /usr/bin/env python3
+
+# seminaive_model: An alternative to build_model.compute_model that
+# computes the same model with semi-naive (round-based) evaluation.
+#
+# Objects and predicates are interned to small integers, so that each
+# relation is a set of int tuples instead of a queue of pddl.Atom objects
+# plus a set of (predicate,) + args tuples. In each round, every rule
+# joins the atoms derived in the previous round (the delta) with the
+# atoms derived before. Only atoms of the requested output predicates are
+# converted back to pddl.Atom objects at the end.
+#
+# The set of atoms in the model is identical to the one computed by
+# build_model.compute_model, but the atoms are listed in a different
+# (deterministic) order. This does not affect the translator output
+# because the SAS task sorts its operators and axioms.
+#
+# The rounds can be evaluated by several worker processes. Each worker owns
+# one shard of the work of every rule, determined by hashing the join key
+# (for join rules) or the tuple of the first condition (for product and
+# project rules), and keeps only the index entries of its shard. In each
+# round, all workers receive the delta, and the master merges their results
+# in the order of the workers. Since hashes of integer tuples do not depend
+# on the process, the result is deterministic.
+
+import itertools
+import multiprocessing
+
+import build_model
+import pddl
+import timers
+from build_model import tuple_getter
+
+
+class SymbolTable:
+    def __init__(self):
+        self.ids = {}
+        self.symbols = []
+    def __len__(self):
+        return len(self.symbols)
+    def intern(self, symbol):
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.ids[symbol] = symbol_id
+            self.symbols.append(symbol)
+        return symbol_id
+    def intern_all(self, symbols):
+        return tuple(self.intern(symbol) for symbol in symbols)
+
+
+class CompiledCondition:
+    def __init__(self, condition, predicates, objects):
+        self.predicate = predicates.intern(condition.predicate)
+        constant_positions = []
+        constants = []
+        for pos, arg in enumerate(condition.args):
+            if not isinstance(arg, int) and arg[0] != "?":
+                constant_positions.append(pos)
+                constants.append(objects.intern(arg))
+        if constant_positions:
+            self.get_constants = tuple_getter(constant_positions)
+            self.constants = tuple(constants)
+        else:
+            self.get_constants = None
+    def select(self, tuples):
+        if self.get_constants is None:
+            return tuples
+        get_constants = self.get_constants
+        constants = self.constants
+        return [tup for tup in tuples if get_constants(tup) == constants]
+
+
+def compile_effect_getter(effect, sources, objects):
+    """Return a function that builds the effect tuple from the
+    concatenation of the condition tuples and the effect constants,
+    together with the tuple of effect constants."""
+    positions, constants = build_model.get_effect_positions(
+        effect, sources, objects.intern)
+    return tuple_getter(positions), constants
+
+
+def get_identity(tup):
+    return tup
+
+
+class CompiledRule:
+    def __init__(self, rule, number, predicates, objects):
+        self.rule = rule
+        self.number = number
+        self.effect_predicate = predicates.intern(rule.effect.predicate)
+        self.conditions = [CompiledCondition(cond, predicates, objects)
+                           for cond in rule.conditions]
+        # For each condition, the function computing the part of a tuple
+        # that determines its shard (or None if the tuples of the condition
+        # are not sharded).
+        self.shard_key_getters = [get_identity] + [None] * (
+            len(rule.conditions) - 1)
+    def restrict_to_shard(self, deltas, shard_no, num_shards):
+        return [
+            delta if get_key is None else
+            [tup for tup in delta if hash(get_key(tup)) % num_shards == shard_no]
+            for delta, get_key in zip(deltas, self.shard_key_getters)]
+
+
+class CompiledJoinRule(CompiledRule):
+    def __init__(self, rule, number, predicates, objects):
+        super().__init__(rule, number, predicates, objects)
+        left_args, right_args = [cond.args for cond in rule.conditions]
+        left_positions, right_positions = rule.common_var_positions
+        self.get_keys = (tuple_getter(left_positions),
+                         tuple_getter(right_positions))
+        self.shard_key_getters = list(self.get_keys)
+        self.indices = ({}, {})
+        # For each condition index, build the effect from the tuple for that
+        # condition, followed by the tuple of the other condition.
+        self.effect_getters = (
+            compile_effect_getter(rule.effect,
+                                  [(left_args, 0),
+                                   (right_args, len(left_args))], objects),
+            compile_effect_getter(rule.effect,
+                                  [(right_args, 0),
+                                   (left_args, len(right_args))], objects))
+    def fire(self, deltas, emit):
+        left_delta, right_delta = deltas
+        # Semi-naive join: delta(L) x (old(R) + delta(R)) + old(L) x delta(R).
+        if right_delta:
+            self._add_to_index(1, right_delta)
+        if left_delta:
+            self._join(0, left_delta, emit)
+        if right_delta:
+            self._join(1, right_delta, emit)
+        if left_delta:
+            self._add_to_index(0, left_delta)
+    def _add_to_index(self, cond_index, tuples):
+        index = self.indices[cond_index]
+        get_key = self.get_keys[cond_index]
+        for tup in tuples:
+            key = get_key(tup)
+            partners = index.get(key)
+            if partners is None:
+                index[key] = [tup]
+            else:
+                partners.append(tup)
+    def _join(self, cond_index, tuples, emit):
+        other_index = self.indices[1 - cond_index]
+        get_key = self.get_keys[cond_index]
+        get_effect, constants = self.effect_getters[cond_index]
+        for tup in tuples:
+            partners = other_index.get(get_key(tup))
+            if partners:
+                for partner in partners:
+                    emit(get_effect(tup + partner + constants))
+
+
+class CompiledProductRule(CompiledRule):
+    def __init__(self, rule, number, predicates, objects):
+        super().__init__(rule, number, predicates, objects)
+        sources = []
+        offset = 0
+        for cond in rule.conditions:
+            sources.append((cond.args, offset))
+            offset += len(cond.args)
+        self.get_effect, self.constants = compile_effect_getter(
+            rule.effect, sources, objects)
+        self.tuples_by_index = [[] for _ in rule.conditions]
+    def fire(self, deltas, emit):
+        # Each combination is produced exactly once, namely for the last
+        # condition whose tuple is new in this round: earlier conditions
+        # range over all tuples, later conditions only over old tuples.
+        get_effect = self.get_effect
+        constants = self.constants
+        for cond_index, delta in enumerate(deltas):
+            if not delta:
+                continue
+            # itertools.product consumes its arguments immediately, so it is
+            # safe to extend the lists afterwards.
+            factors = list(self.tuples_by_index)
+            factors[cond_index] = delta
+            if all(factors):
+                for combination in itertools.product(*factors):
+                    emit(get_effect(sum(combination, ()) + constants))
+            self.tuples_by_index[cond_index].extend(delta)
+
+
+class CompiledProjectRule(CompiledRule):
+    def __init__(self, rule, number, predicates, objects):
+        super().__init__(rule, number, predicates, objects)
+        self.get_effect, self.constants = compile_effect_getter(
+            rule.effect, [(rule.conditions[0].args, 0)], objects)
+    def fire(self, deltas, emit):
+        get_effect = self.get_effect
+        constants = self.constants
+        for tup in deltas[0]:
+            emit(get_effect(tup + constants))
+
+
+COMPILED_RULE_TYPES = {
+    build_model.JoinRule: CompiledJoinRule,
+    build_model.ProductRule: CompiledProductRule,
+    build_model.ProjectRule: CompiledProjectRule,
+}
+
+
+def compile_rules(rules, predicates, objects):
+    return [COMPILED_RULE_TYPES[type(rule)](rule, number, predicates, objects)
+            for number, rule in enumerate(rules)]
+
+
+class Model:
+    """The relations of the model under construction, indexed by
+    predicate id. Each relation is a set of object id tuples."""
+    def __init__(self, num_predicates):
+        self.relations = [set() for _ in range(num_predicates)]
+        self.num_atoms = 0
+    def add_new(self, predicate, tuples):
+        """Add the given tuples to the relation of the predicate and return
+        the list of tuples that were not contained in it before."""
+        relation = self.relations[predicate]
+        new_tuples = []
+        for tup in tuples:
+            if tup not in relation:
+                relation.add(tup)
+                new_tuples.append(tup)
+        self.num_atoms += len(new_tuples)
+        return new_tuples
+
+
+def get_rules_by_condition_predicate(compiled_rules):
+    result = {}
+    for rule in compiled_rules:
+        for predicate in {cond.predicate for cond in rule.conditions}:
+            result.setdefault(predicate, []).append(rule)
+    return result
+
+
+def evaluate_round(rules_by_predicate, delta, shard=None):
+    """Fire all rules for the given delta and return a dictionary mapping
+    predicate ids to the derived tuples (including old ones). If shard is a
+    (shard_no, num_shards) pair, only do the work of that shard."""
+    derived = {}
+    active_rules = {}
+    for predicate in delta:
+        for rule in rules_by_predicate.get(predicate, ()):
+            active_rules[rule.number] = rule
+    # Fire rules in a fixed order to make the result deterministic.
+    for _, rule in sorted(active_rules.items()):
+        deltas = [cond.select(delta.get(cond.predicate, ()))
+                  for cond in rule.conditions]
+        if shard is not None:
+            deltas = rule.restrict_to_shard(deltas, *shard)
+        if any(deltas):
+            # We use dictionaries as insertion-ordered sets.
+            effect_tuples = derived.setdefault(rule.effect_predicate, {})
+            rule.fire(deltas, effect_tuples.setdefault)
+    return derived
+
+
+def evaluate(compiled_rules, model, initial_delta):
+    """Run semi-naive evaluation until a fixpoint is reached. Yield the
+    delta of each round as a dictionary mapping predicate ids to lists of
+    new tuples (including the initial delta)."""
+    rules_by_predicate = get_rules_by_condition_predicate(compiled_rules)
+    delta = initial_delta
+    while delta:
+        yield delta
+        derived = evaluate_round(rules_by_predicate, delta)
+        delta = {}
+        for predicate, tuples in derived.items():
+            new_tuples = model.add_new(predicate, tuples)
+            if new_tuples:
+                delta[predicate] = new_tuples
+
+
+def run_worker(compiled_rules, connection, shard_no, num_shards):
+    rules_by_predicate = get_rules_by_condition_predicate(compiled_rules)
+    while True:
+        delta = connection.recv()
+        if delta is None:
+            break
+        derived = evaluate_round(rules_by_predicate, delta,
+                                 (shard_no, num_shards))
+        connection.send({predicate: list(tuples)
+                         for predicate, tuples in derived.items()})
+    connection.close()
+
+
+def can_evaluate_in_parallel():
+    # The workers inherit the compiled rules, which cannot be pickled.
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def evaluate_in_parallel(compiled_rules, model, initial_delta, num_workers):
+    """Like evaluate, but distribute the work of each round over
+    num_workers worker processes."""
+    context = multiprocessing.get_context("fork")
+    connections = []
+    workers = []
+    for shard_no in range(num_workers):
+        connection, worker_connection = context.Pipe()
+        worker = context.Process(
+            target=run_worker,
+            args=(compiled_rules, worker_connection, shard_no, num_workers),
+            daemon=True)
+        worker.start()
+        worker_connection.close()
+        connections.append(connection)
+        workers.append(worker)
+    try:
+        delta = initial_delta
+        while delta:
+            yield delta
+            for connection in connections:
+                connection.send(delta)
+            delta = {}
+            for connection in connections:
+                for predicate, tuples in connection.recv().items():
+                    new_tuples = model.add_new(predicate, tuples)
+                    if new_tuples:
+                        delta.setdefault(predicate, []).extend(new_tuples)
+        for connection in connections:
+            connection.send(None)
+    finally:
+        for connection in connections:
+            connection.close()
+        for worker in workers:
+            worker.join()
+
+
+def is_auxiliary_predicate(predicate):
+    return isinstance(predicate, str) and "$" in predicate
+
+
+def compute_model(prog, output_predicates=None, num_workers=1, budget=None):
+    """Compute the model of the Datalog program prog.
+    Return the list of atoms of the model whose predicate is in
+    output_predicates (or all non-auxiliary atoms if output_predicates is
+    None) in the order in which they were derived. With num_workers > 1,
+    the rounds are evaluated by that many worker processes if the platform
+    supports it. If budget is given, it is checked after each round (see
+    grounding_budget.py)."""
+    with timers.timing("Preparing model"):
+        rules = build_model.convert_rules(prog)
+        predicates = SymbolTable()
+        objects = SymbolTable()
+        initial_delta = {}
+        for fact in prog.facts:
+            predicate = predicates.intern(fact.atom.predicate)
+            tup = objects.intern_all(fact.atom.args)
+            initial_delta.setdefault(predicate, {})[tup] = None
+        compiled_rules = compile_rules(rules, predicates, objects)
+        model = Model(len(predicates))
+        initial_delta = {predicate: model.add_new(predicate, tuples)
+                         for predicate, tuples in initial_delta.items()}
+        if output_predicates is None:
+            is_output_predicate = [not is_auxiliary_predicate(pred)
+                                   for pred in predicates.symbols]
+        else:
+            is_output_predicate = [pred in output_predicates
+                                   for pred in predicates.symbols]
+
+    print("Generated %d rules." % len(rules))
+    if num_workers > 1 and not can_evaluate_in_parallel():
+        print("Parallel model computation is not supported on this "
+              "platform. Using a single process.")
+        num_workers = 1
+    if num_workers > 1:
+        print("Using %d worker processes." % num_workers)
+        deltas = evaluate_in_parallel(
+            compiled_rules, model, initial_delta, num_workers)
+    else:
+        deltas = evaluate(compiled_rules, model, initial_delta)
+    with timers.timing("Computing model"):
+        num_rounds = 0
+        result = []
+        object_names = objects.symbols
+        for delta in deltas:
+            if budget is not None:
+                budget.check_model(result, model.num_atoms)
+            num_rounds += 1
+            for predicate, tuples in delta.items():
+                if is_output_predicate[predicate]:
+                    symbol = predicates.symbols[predicate]
+                    for tup in tuples:
+                        result.append(pddl.Atom(
+                            symbol, [object_names[obj] for obj in tup]))
+        if budget is not None:
+            budget.check_model(result, model.num_atoms)
+    auxiliary_atoms = sum(
+        len(relation)
+        for predicate, relation in zip(predicates.symbols, model.relations)
+        if is_auxiliary_predicate(predicate))
+    print("%d relevant atoms" % (model.num_atoms - auxiliary_atoms))
+    print("%d auxiliary atoms" % auxiliary_atoms)
+    print("%d output atoms" % len(result))
+    print("%d rounds of semi-naive evaluation" % num_rounds)
+    return result
+
+
+if __name__ == "__main__":
+    import pddl_parser
+    import normalize
+    import pddl_to_prolog
+
+    print("Parsing...")
+    task = pddl_parser.open()
+    print("Normalizing...")
+    normalize.normalize(task)
+    print("Writing rules...")
+    prog = pddl_to_prolog.translate(task)
+
+    model = compute_model(prog)
+    for atom in model:
+        print(atom)
+    print("%d atoms" % len(model))
@@ -28,7 +28,7 @@ def project_rule(rule, conditions, name_generator):
     projected_rule = Rule(conditions, effect)
     return projected_rule
 
-def split_rule(rule, name_generator):
+def split_rule(rule, name_generator, statistics=None):
     important_conditions, trivial_conditions = [], []
     for cond in rule.conditions:
         for arg in cond.args:
@@ -43,13 +43,14 @@ def split_rule(rule, name_generator):
 
     components = get_connected_conditions(important_conditions)
     if len(components) == 1 and not trivial_conditions:
-        return split_into_binary_rules(rule, name_generator)
+        return split_into_binary_rules(rule, name_generator, statistics)
 
     projected_rules = [project_rule(rule, conditions, name_generator)
                        for conditions in components]
     result = []
     for proj_rule in projected_rules:
-        result += split_into_binary_rules(proj_rule, name_generator)
+        result += split_into_binary_rules(proj_rule, name_generator,
+                                          statistics)
 
     conditions = ([proj_rule.effect for proj_rule in projected_rules] +
                   trivial_conditions)
@@ -61,8 +62,8 @@ def split_rule(rule, name_generator):
     result.append(combining_rule)
     return result
 
-def split_into_binary_rules(rule, name_generator):
+def split_into_binary_rules(rule, name_generator, statistics=None):
     if len(rule.conditions) <= 1:
         rule.type = "project"
         return [rule]
-    return greedy_join.greedy_join(rule, name_generator)
+    return greedy_join.greedy_join(rule, name_generator, statistics)
@@ -1,3 +1,7 @@
+from contextlib import contextmanager
+import gc
+
+
 def get_peak_memory_in_kb():
     try:
         # This will only work on Linux systems.
@@ -9,3 +13,17 @@ def get_peak_memory_in_kb():
     except OSError:
         pass
     raise Warning("warning: could not determine peak memory")
+
+
+@contextmanager
+def garbage_collection_disabled():
+    # Creating many containers that survive for a while triggers frequent
+    # full runs of the cyclic garbage collector, whose cost grows with the
+    # (large) data of the translator.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_was_enabled:
+            gc.enable()
@@ -4,7 +4,7 @@
 import os
 import sys
 import traceback
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 VarValPair = Tuple[int, int]
 
@@ -17,15 +17,18 @@ if not python_version_supported():
 
 from collections import defaultdict
 from copy import deepcopy
-from itertools import product
+from itertools import chain, product
 
 import axiom_rules
+import domain_cache
 import fact_groups
+import grounding_budget
 import instantiate
 import normalize
 import options
 import pddl
 import pddl_parser
+import propositional
 import sas_tasks
 import signal
 import simplify
@@ -50,6 +53,7 @@ DEBUG = False
 ## we only list codes that are used by the translator component of the planner.
 TRANSLATE_OUT_OF_MEMORY = 20
 TRANSLATE_OUT_OF_TIME = 21
+TRANSLATE_OUT_OF_GROUNDING_BUDGET = 25
 TRANSLATE_INPUT_ERROR = 31
 
 simplified_effect_condition_counter = 0
@@ -401,6 +405,33 @@ def translate_strips_operators(actions, strips_to_sas, ranges, mutex_dict,
     return result
 
 
+def mentions_derived_predicate(action, derived_predicates):
+    return (any(literal.predicate in derived_predicates
+                for literal in action.precondition) or
+            any(literal.predicate in derived_predicates
+                for condition, _ in chain(action.add_effects,
+                                          action.del_effects)
+                for literal in condition))
+
+
+def translate_strips_operators_to_store(actions, axioms, strips_to_sas,
+                                        ranges, mutex_dict, mutex_ranges,
+                                        implied_facts):
+    """Translate the actions, which may be generated lazily, into an
+    OperatorStore. Return the store and the list of actions that mention
+    derived predicates, which are the only ones axiom processing needs."""
+    derived_predicates = {axiom.effect.predicate for axiom in axioms}
+    operators = sas_tasks.OperatorStore()
+    relevant_actions = []
+    for action in actions:
+        if mentions_derived_predicate(action, derived_predicates):
+            relevant_actions.append(action)
+        operators.extend(translate_strips_operator(
+            action, strips_to_sas, ranges, mutex_dict, mutex_ranges,
+            implied_facts))
+    return operators, relevant_actions
+
+
 def translate_strips_axioms(axioms, strips_to_sas, ranges, mutex_dict,
                             mutex_ranges):
     result = []
@@ -453,10 +484,18 @@ def translate_task(
         mutex_key: List[List[VarValPair]],
         init: List[Union[pddl.Atom, pddl.Assign]],
         goals: List[pddl.Literal],
-        actions: List[pddl.PropositionalAction],
+        actions: Iterable[pddl.PropositionalAction],
         axioms: List[pddl.PropositionalAxiom],
         metric: bool,
         implied_facts: Dict[VarValPair, List[VarValPair]]) -> sas_tasks.SASTask:
+    stream_operators = options.stream_operators and not options.dump_task
+    if stream_operators:
+        with timers.timing("Translating operators to operator store"):
+            operators, actions = translate_strips_operators_to_store(
+                actions, axioms, strips_to_sas, ranges, mutex_dict,
+                mutex_ranges, implied_facts)
+            print("%d operators stored" % len(operators))
+
     with timers.timing("Processing axioms", block=True):
         axioms, axiom_layer_dict = axiom_rules.handle_axioms(actions, axioms, goals,
                                                              options.layer_strategy)
@@ -496,9 +535,10 @@ def translate_task(
         return solvable_sas_task("Empty goal")
     goal = sas_tasks.SASGoal(goal_pairs)
 
-    operators = translate_strips_operators(actions, strips_to_sas, ranges,
-                                           mutex_dict, mutex_ranges,
-                                           implied_facts)
+    if not stream_operators:
+        operators = translate_strips_operators(actions, strips_to_sas, ranges,
+                                               mutex_dict, mutex_ranges,
+                                               implied_facts)
     axioms = translate_strips_axioms(axioms, strips_to_sas, ranges, mutex_dict,
                                      mutex_ranges)
 
@@ -542,9 +582,20 @@ def unsolvable_sas_task(msg):
     return trivial_task(solvable=False)
 
 def pddl_to_sas(task):
+    use_propositional_pipeline = (
+        options.propositional_fast_path and
+        not options.relevance_analysis and
+        propositional.is_propositional(task))
+    if use_propositional_pipeline:
+        print("Using the pipeline for propositional tasks.")
+
     with timers.timing("Instantiating", block=True):
-        (relaxed_reachable, atoms, actions, goal_list, axioms,
-         reachable_action_params) = instantiate.explore(task)
+        if use_propositional_pipeline:
+            (relaxed_reachable, atoms, actions, goal_list, axioms,
+             reachable_action_params) = propositional.explore(task)
+        else:
+            (relaxed_reachable, atoms, actions, goal_list, axioms,
+             reachable_action_params) = instantiate.explore(task)
 
     if not relaxed_reachable:
         return unsolvable_sas_task("No relaxed solution")
@@ -558,8 +609,13 @@ def pddl_to_sas(task):
             negative_in_goal.add(item.negate())
 
     with timers.timing("Computing fact groups", block=True):
-        groups, mutex_groups, translation_key = fact_groups.compute_groups(
-            task, atoms, reachable_action_params, negative_in_goal)
+        if use_propositional_pipeline:
+            groups, mutex_groups, translation_key = (
+                propositional.compute_groups(
+                    task, atoms, actions, negative_in_goal))
+        else:
+            groups, mutex_groups, translation_key = fact_groups.compute_groups(
+                task, atoms, reachable_action_params, negative_in_goal)
 
     with timers.timing("Building STRIPS to SAS dictionary"):
         ranges, strips_to_sas = strips_to_sas_dictionary(
@@ -701,12 +757,21 @@ def dump_statistics(sas_task):
 
 def main():
     timer = timers.Timer()
-    with timers.timing("Parsing", True):
-        task = pddl_parser.open(
-            domain_filename=options.domain, task_filename=options.task)
-
-    with timers.timing("Normalizing task"):
-        normalize.normalize(task)
+    with pddl.hash_consing(options.hash_cons_conditions):
+        if options.domain_cache:
+            # The domain cache returns normalized tasks.
+            with timers.timing("Parsing", True):
+                task = domain_cache.open_task(
+                    options.domain, options.task, options.domain_cache,
+                    options.domain_cache_max_size * 1024 * 1024,
+                    options.max_dnf_size)
+        else:
+            with timers.timing("Parsing", True):
+                task = pddl_parser.open(
+                    domain_filename=options.domain, task_filename=options.task,
+                    parallel=options.parallel_parsing)
+            with timers.timing("Normalizing task"):
+                normalize.normalize(task, options.max_dnf_size)
 
     if options.generate_relaxed_task:
         # Remove delete effects.
@@ -756,3 +821,5 @@ if __name__ == "__main__":
     except pddl_parser.ParseError as e:
         print(e)
         sys.exit(TRANSLATE_INPUT_ERROR)
+    except grounding_budget.GroundingBudgetExceeded:
+        sys.exit(TRANSLATE_OUT_OF_GROUNDING_BUDGET)
@@ -233,25 +233,30 @@ class VariableOrder:
         mutexes[:] = new_mutexes
 
     def _apply_to_operators(self, operators):
-        new_ops = []
-        for op in operators:
-            pre_post = []
-            for eff_var, pre, post, cond in op.pre_post:
-                if eff_var in self.new_var:
-                    new_cond = list((self.new_var[var], val)
-                                    for var, val in cond
-                                    if var in self.new_var)
-                    pre_post.append(
-                        (self.new_var[eff_var], pre, post, new_cond))
-            if pre_post:
-                op.pre_post = pre_post
-                op.prevail = [(self.new_var[var], val)
-                              for var, val in op.prevail
-                              if var in self.new_var]
-                new_ops.append(op)
-        print("%s of %s operators necessary." % (len(new_ops),
-                                                 len(operators)))
-        operators[:] = new_ops
+        # operators may be a sas_tasks.OperatorStore, so we generate the
+        # new operators instead of collecting them in a list.
+        num_operators = len(operators)
+
+        def translate_operators():
+            for op in operators:
+                pre_post = []
+                for eff_var, pre, post, cond in op.pre_post:
+                    if eff_var in self.new_var:
+                        new_cond = list((self.new_var[var], val)
+                                        for var, val in cond
+                                        if var in self.new_var)
+                        pre_post.append(
+                            (self.new_var[eff_var], pre, post, new_cond))
+                if pre_post:
+                    op.pre_post = pre_post
+                    op.prevail = [(self.new_var[var], val)
+                                  for var, val in op.prevail
+                                  if var in self.new_var]
+                    yield op
+
+        operators[:] = translate_operators()
+        print("%s of %s operators necessary." % (len(operators),
+                                                 num_operators))
 
     def _apply_to_axioms(self, axioms):
         new_axioms = []